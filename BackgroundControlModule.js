@@ -0,0 +1,27 @@
+// BackgroundControlModule.js
+var BackgroundControlModule = function(fast_forward_steps) {
+    // Create the controls, send() is the websocket helper of runcontrol.js
+    var div = $("<div style='margin: 10px 0px'></div>");
+    var step_label = $("<span style='margin-right: 20px'>Step: 0</span>");
+    var forward_input = $("<input type='number' min='1' style='width: 80px'>").val(fast_forward_steps);
+    var forward_button = $("<button class='btn btn-default'>Fast-forward</button>");
+    var show_input = $("<input type='number' min='0' style='width: 80px; margin-left: 20px'>").val(0);
+    var show_button = $("<button class='btn btn-default'>Show step</button>");
+    div.append(step_label, forward_input, forward_button, show_input, show_button);
+    $("#elements").append(div);
+
+    forward_button.on("click", function() {
+        send({"type": "fast_forward", "steps": Number(forward_input.val())});
+    });
+    show_button.on("click", function() {
+        send({"type": "get_snapshot", "step": Number(show_input.val())});
+    });
+
+    this.render = function(data) {
+        step_label.text("Step: " + data);
+    };
+
+    this.reset = function() {
+        step_label.text("Step: 0");
+    };
+};
@@ -0,0 +1,115 @@
+// GridFrameModule.js
+var GridFrameModule = function(canvas_width, canvas_height) {
+    // Create the tag:
+    var canvas_tag = "<canvas width='" + canvas_width + "' height='" + canvas_height + "' ";
+    canvas_tag += "style='border:1px dotted'></canvas>";
+    // Append it to body:
+    var canvas = $(canvas_tag)[0];
+    $("#elements").append(canvas);
+    var context = canvas.getContext("2d");
+
+    // One pixel per cell, scaled up to the visible canvas when drawn
+    var grid_canvas = document.createElement("canvas");
+    var grid_context = grid_canvas.getContext("2d");
+    var image = null;
+    var cells = null; // 3 bytes per flat cell (x*width + y): type code, strongest belief code, flags
+    var x_cells = 0;
+    var y_cells = 0;
+
+    var EMPTY = 255;
+    var HAPPY = 1, EXTRA_POWER = 4, EXTRA_DETERMINATION = 8;
+    var BELIEFS = ["A", "B", "C"];
+    // [type code][strongest belief code]: emotivists in reds, virtuous agents in blues
+    var COLORS = [[[255, 0, 0], [190, 0, 70], [255, 120, 0]],
+                  [[0, 0, 255], [0, 130, 255], [110, 0, 200]]];
+    // by extra power / extra determination, as the stroke colors of ve_draw in server.py
+    var STROKES = [null, "#FF0000", "#00FF00", "#FFFF00"];
+    var MIN_TEXT_CELL = 12; // pixels per cell from which belief letters and strokes are drawn
+
+    var decode = function(text) {
+        var raw = atob(text);
+        var bytes = new Uint8Array(raw.length);
+        for (var i = 0; i < raw.length; i++)
+            bytes[i] = raw.charCodeAt(i);
+        return bytes;
+    };
+
+    var paint = function(cell) {
+        var x = Math.floor(cell / y_cells);
+        var y = cell % y_cells;
+        var p = 4 * ((y_cells - 1 - y) * x_cells + x); // y = 0 at the bottom, as CanvasGrid
+        var type = cells[3*cell];
+        var color = [255, 255, 255];
+        if (type != EMPTY) {
+            color = COLORS[type][cells[3*cell + 1] % 3];
+            if (!(cells[3*cell + 2] & HAPPY)) // unhappy agents are paler
+                color = [(color[0] + 255) >> 1, (color[1] + 255) >> 1, (color[2] + 255) >> 1];
+        }
+        image.data[p] = color[0];
+        image.data[p + 1] = color[1];
+        image.data[p + 2] = color[2];
+        image.data[p + 3] = 255;
+    };
+
+    var draw = function() {
+        grid_context.putImageData(image, 0, 0);
+        context.imageSmoothingEnabled = false;
+        context.clearRect(0, 0, canvas.width, canvas.height);
+        context.drawImage(grid_canvas, 0, 0, canvas.width, canvas.height);
+        var cell_width = canvas.width / x_cells;
+        var cell_height = canvas.height / y_cells;
+        if (Math.min(cell_width, cell_height) < MIN_TEXT_CELL)
+            return;
+        context.font = Math.floor(cell_height / 2) + "px sans-serif";
+        context.textAlign = "center";
+        context.textBaseline = "middle";
+        context.lineWidth = 2;
+        for (var cell = 0; cell < x_cells * y_cells; cell++) {
+            if (cells[3*cell] == EMPTY)
+                continue;
+            var left = Math.floor(cell / y_cells) * cell_width;
+            var top = (y_cells - 1 - cell % y_cells) * cell_height;
+            var stroke = STROKES[(cells[3*cell + 2] & (EXTRA_POWER | EXTRA_DETERMINATION)) >> 2];
+            if (stroke !== null) {
+                context.strokeStyle = stroke;
+                context.strokeRect(left + 1, top + 1, cell_width - 2, cell_height - 2);
+            }
+            context.fillStyle = "#FFFFFF";
+            context.fillText(BELIEFS[cells[3*cell + 1]], left + cell_width / 2, top + cell_height / 2);
+        }
+    };
+
+    this.render = function(data) {
+        if (data.full) {
+            x_cells = data.height; // the x extent of the model's grid
+            y_cells = data.width;
+            cells = decode(data.values);
+            grid_canvas.width = x_cells;
+            grid_canvas.height = y_cells;
+            image = grid_context.createImageData(x_cells, y_cells);
+            for (var cell = 0; cell < x_cells * y_cells; cell++)
+                paint(cell);
+        }
+        else {
+            if (cells === null)
+                return;
+            // bitmask of the changed cells, then their 3 bytes in cell order
+            var changed = decode(data.changed);
+            var values = decode(data.values);
+            var i = 0;
+            for (var cell = 0; cell < x_cells * y_cells; cell++) {
+                if (changed[cell >> 3] & (1 << (cell & 7))) {
+                    cells.set(values.subarray(3*i, 3*i + 3), 3*cell);
+                    paint(cell);
+                    i++;
+                }
+            }
+        }
+        draw();
+    };
+
+    this.reset = function() {
+        cells = null;
+        context.clearRect(0, 0, canvas.width, canvas.height);
+    };
+};
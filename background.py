@@ -0,0 +1,223 @@
+import collections
+import threading
+from types import SimpleNamespace
+
+import tornado.escape
+from mesa.visualization.ModularVisualization import ModularServer, SocketHandler
+
+from recording import Recording
+
+'''
+Background stepping for the ModularServer visualization (server.py --background).
+
+ModularServer steps the model inside the websocket request of every frame, so the simulation
+runs at the frame rate of the browser. BackgroundModularServer steps the model in a background
+thread instead, up to "ahead" steps past the last step shown, and keeps snapshots of the last
+"history" steps. Every frame the browser gets the latest snapshot; it can also fast-forward
+thousands of steps, which are simulated without being rendered, or show any step still in the
+history (BackgroundControlModule in visualization.py).
+ReplayModularServer (server.py --replay PATH) serves the steps of a recording.Recording the
+same way, without simulating.
+'''
+
+# model-level counters copied into snapshots, as read by the text elements
+COUNTERS = ["happy", "convinced", "virtuous_count", "emotivist_count", "virtuous_death_count"]
+
+class ModelSnapshot:
+    '''
+    Read-only copy of what the visualization elements read from a model at one step: the
+    neighborhood arrays and belief counters, the step count, the model-level counters and the
+    latest datacollector values. origin is the model it was taken from.
+    '''
+    def __init__(self, model):
+        neighborhood = model.grid.neighborhood
+        self.origin = model
+        self.grid = SimpleNamespace(neighborhood=SimpleNamespace(height=neighborhood.height, width=neighborhood.width
+            , types=bytes(neighborhood.types), belief_codes=bytes(neighborhood.belief_codes), flags=bytes(neighborhood.flags)
+            , belief_counts=[list(counts) for counts in neighborhood.belief_counts]))
+        self.schedule = SimpleNamespace(steps=model.schedule.steps)
+        self.datacollector = SimpleNamespace(model_vars={name: values[-1:] for name, values in model.datacollector.model_vars.items()})
+        self.running = model.running
+        self.message = model.message
+        for name in COUNTERS:
+            setattr(self, name, getattr(model, name))
+
+class BackgroundRunner:
+    '''
+    Steps model in a daemon thread until it is "ahead" steps past the last snapshot taken with
+    latest() (or a fast_forward target), keeping a snapshot of each of the last "history" steps.
+    The model itself must not be touched by other threads while the runner is alive.
+    '''
+    def __init__(self, model, ahead=100, history=64):
+        self.model = model
+        self.ahead = ahead
+        self.snapshots = collections.deque([ModelSnapshot(model)], maxlen=history)
+        self.target = model.schedule.steps + ahead
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.finished = False # the thread ended, every step the model took has a snapshot
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        model = self.model
+        try:
+            while True:
+                with self.condition:
+                    while not self.stopped and model.running and model.schedule.steps >= self.target:
+                        self.condition.wait()
+                    if self.stopped or not model.running:
+                        break
+                model.step()
+                snapshot = ModelSnapshot(model)
+                with self.condition:
+                    self.snapshots.append(snapshot)
+                    self.condition.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError("Background simulation failed") from self.error
+
+    def latest(self):
+        '''
+        Snapshot of the latest step, which lets the model run on to "ahead" steps past it.
+        '''
+        self._check()
+        with self.condition:
+            snapshot = self.snapshots[-1]
+            self.target = max(self.target, snapshot.schedule.steps + self.ahead)
+            self.condition.notify_all()
+        return snapshot
+
+    def snapshot(self, steps):
+        '''
+        Snapshot of step "steps", or None if it is not (or no longer) in the history.
+        '''
+        self._check()
+        with self.condition:
+            for snapshot in self.snapshots:
+                if snapshot.schedule.steps == steps:
+                    return snapshot
+        return None
+
+    def fast_forward(self, steps):
+        '''
+        Let the model run on to "steps" steps past the latest snapshot, without waiting for the display.
+        '''
+        with self.condition:
+            self.target = max(self.target, self.snapshots[-1].schedule.steps + steps)
+            self.condition.notify_all()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+
+class ReplayRunner:
+    '''
+    BackgroundRunner interface over the recorded steps of a recording.Recording: latest() moves
+    on by one recorded step per call, fast_forward and snapshot move to any recorded step.
+    '''
+    def __init__(self, recording):
+        self.recording = recording
+        self.steps = recording.steps().tolist()
+        self.position = 0 # index into steps of the step latest() shows next
+        self.finished = False
+        self.current = None
+
+    def _show(self, position):
+        self.position = min(position, len(self.steps) - 1) + 1
+        self.finished = self.position >= len(self.steps)
+        steps = self.steps[self.position - 1]
+        if self.current is None or self.current.schedule.steps != steps:
+            self.current = self.recording.snapshot(steps)
+        return self.current
+
+    def latest(self):
+        return self._show(self.position)
+
+    def snapshot(self, steps):
+        if steps not in self.steps:
+            return None
+        return self._show(self.steps.index(steps))
+
+    def fast_forward(self, steps):
+        self.position = max(0, self.position - 1 + steps)
+
+    def stop(self):
+        pass
+
+class BackgroundSocketHandler(SocketHandler):
+    '''
+    SocketHandler for BackgroundModularServer: "get_step" shows the latest snapshot instead of
+    stepping the model (nothing is sent while no step newer than the one shown is ready), and
+    "fast_forward" and "get_snapshot" messages come from BackgroundControlModule.
+    '''
+    def on_message(self, message):
+        msg = tornado.escape.json_decode(message)
+        application = self.application
+        runner = application.runner
+        if msg["type"] == "get_step":
+            snapshot = runner.latest()
+            if snapshot is not application.shown:
+                self.write_message(application.render_snapshot(snapshot))
+            elif runner.finished:
+                self.write_message({"type": "end"})
+        elif msg["type"] == "fast_forward":
+            runner.fast_forward(int(msg["steps"]))
+        elif msg["type"] == "get_snapshot":
+            snapshot = runner.snapshot(int(msg["step"]))
+            if snapshot is not None:
+                self.write_message(application.render_snapshot(snapshot))
+        else:
+            super().on_message(message)
+
+class BackgroundModularServer(ModularServer):
+    '''
+    ModularServer whose model is stepped by a BackgroundRunner; elements render snapshots.
+    '''
+    socket_handler = (r'/ws', BackgroundSocketHandler)
+    handlers = [ModularServer.page_handler, socket_handler, ModularServer.static_handler, ModularServer.local_handler]
+
+    def __init__(self, model_cls, visualization_elements, name="Mesa Model", model_params={}, ahead=100, history=64):
+        self.ahead = ahead
+        self.history = history
+        self.runner = None
+        self.shown = None
+        super().__init__(model_cls, visualization_elements, name, model_params)
+
+    def reset_model(self):
+        if self.runner is not None:
+            self.runner.stop()
+        super().reset_model()
+        self.runner = BackgroundRunner(self.model, self.ahead, self.history)
+        self.shown = None
+
+    def render_snapshot(self, snapshot):
+        self.shown = snapshot
+        return {"type": "viz_state", "data": [element.render(snapshot) for element in self.visualization_elements]}
+
+    def render_model(self):
+        # used by mesa's "reset" message
+        return self.render_snapshot(self.runner.latest())["data"]
+
+class ReplayModularServer(BackgroundModularServer):
+    '''
+    BackgroundModularServer that replays the recording at path instead of running a model.
+    '''
+    def __init__(self, model_cls, visualization_elements, name="Mesa Model", path=None):
+        self.recording = Recording(path)
+        super().__init__(model_cls, visualization_elements, name, {})
+
+    def reset_model(self):
+        self.model = None
+        self.runner = ReplayRunner(self.recording)
+        self.shown = None
@@ -0,0 +1,192 @@
+import argparse
+import itertools
+import json
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sweep import DEFAULT_PARAMS, model_args
+
+'''
+Benchmarks of VirtuousEmotivistModel construction and stepping.
+
+Every configuration (grid size x density x minority fraction x homophily) is run in a fresh
+worker process, so the reported peak memory (max RSS growth over the process baseline) belongs
+to that configuration alone:
+
+    python benchmark.py --sizes 25 100 500 --densities 0.8 0.95 --steps 20 --output baseline.json
+    python benchmark.py --sizes 25 100 500 --densities 0.8 0.95 --steps 20 --compare baseline.json
+
+--events prints the mean event counts per step (model.EVENTS: arguments, nudges, conversions,
+random and unhappy moves), which explain where step time goes. --phases splits step time into
+phases with PhaseProfiler, which can also be used on its own:
+
+    with PhaseProfiler() as profiler:
+        model = VirtuousEmotivistModel(...)
+        for i in range(100):
+            model.step()
+    print(profiler.report())
+'''
+
+class PhaseProfiler:
+    '''
+    Opt-in per-phase step timing. While active, the model methods of each phase are wrapped with
+    timers (the classes are patched on enter and restored on exit, so models pay nothing when no
+    profiler is active). Times are exclusive: a conversion (EmotivistAgent.become_virtuous, in place)
+    charges removing and placing the agent to "conversion" but its remove_from_counts call to
+    "count updates". "agent logic" is the rest of the scheduler loop, i.e.
+    the agents' own step code (random decisions, happiness, life force).
+    '''
+    def __init__(self):
+        from model import BelievingAgent, EmotivistAgent, VirtuousAgent, VirtuousEmotivistModel, ModelRandomActivation
+        from neighborhood import Neighborhood
+        self.targets = [
+            (ModelRandomActivation, "step", "agent logic"),
+            (Neighborhood, "occupied_neighbors", "neighbor lookup"),
+            (EmotivistAgent, "emotivist_argument", "argument/strengthen"),
+            (VirtuousAgent, "strenghten_tradition", "argument/strengthen"),
+            (VirtuousAgent, "convert_emotivist", "conversion"),
+            (BelievingAgent, "move_to_empty", "movement"),
+            (BelievingAgent, "die", "death"),
+            (VirtuousEmotivistModel, "collect", "data collection"),
+            (BelievingAgent, "set_happy_convinced", "count updates"),
+            (VirtuousEmotivistModel, "remove_from_counts", "count updates"),
+        ]
+        self.times = {}
+        self.calls = {}
+        self.stack = []
+        self.saved = []
+
+    def _wrap(self, function, phase):
+        profiler = self
+        def timed(*args, **kwargs):
+            profiler.enter(phase)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.exit()
+        return timed
+
+    def enter(self, phase):
+        now = time.perf_counter()
+        if self.stack:
+            parent, start = self.stack[-1]
+            self.times[parent] = self.times.get(parent, 0.0) + now - start
+        self.stack.append((phase, now))
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+
+    def exit(self):
+        now = time.perf_counter()
+        phase, start = self.stack.pop()
+        self.times[phase] = self.times.get(phase, 0.0) + now - start
+        if self.stack:
+            self.stack[-1] = (self.stack[-1][0], now) # the parent resumes now
+
+    def __enter__(self):
+        for cls, name, phase in self.targets:
+            self.saved.append((cls, name, cls.__dict__.get(name)))
+            setattr(cls, name, self._wrap(getattr(cls, name), phase))
+        return self
+
+    def __exit__(self, *exc):
+        for cls, name, original in reversed(self.saved):
+            if original is None:
+                delattr(cls, name)
+            else:
+                setattr(cls, name, original)
+        self.saved = []
+        return False
+
+    def report(self):
+        '''
+        Table of the time spent in each phase, slowest first.
+        '''
+        total = sum(self.times.values()) or 1.0
+        lines = []
+        for phase, seconds in sorted(self.times.items(), key=lambda item: -item[1]):
+            lines.append("{:<22} {:9.3f} s {:6.1f} % {:10d} calls".format(phase, seconds, 100*seconds/total, self.calls[phase]))
+        return "\n".join(lines)
+
+def _max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0 # kilobytes on Linux
+
+def benchmark_config(size, density, minority_pc, homophily, steps, phases=False, seed=1):
+    '''
+    Construct one model and run it for "steps" steps. Returns a dict of timings and peak memory.
+    '''
+    from model import VirtuousEmotivistModel, EVENTS
+    spec = {"base": {"height": size, "width": size, "density": density, "minority_pc": minority_pc, "homophily": homophily}}
+    args = model_args(spec, [], seed, ())
+    rss_before = _max_rss_mb()
+    start = time.perf_counter()
+    model = VirtuousEmotivistModel(*args)
+    construct = time.perf_counter() - start
+    profiler = PhaseProfiler() if phases else None
+    if profiler is not None:
+        profiler.__enter__()
+    try:
+        start = time.perf_counter()
+        for i in range(steps):
+            model.step()
+        stepping = time.perf_counter() - start
+    finally:
+        if profiler is not None:
+            profiler.__exit__(None, None, None)
+    result = {"size": size, "density": density, "minority_pc": minority_pc, "homophily": homophily, "steps": steps
+        , "agents": model.schedule.get_agent_count(), "construct_s": construct, "steps_per_s": steps / stepping
+        , "peak_mb": _max_rss_mb() - rss_before}
+    # mean events per step, without the setup collection
+    result["events"] = {name: sum(model.datacollector.model_vars[name][1:]) / float(max(steps, 1)) for name in EVENTS}
+    if profiler is not None:
+        result["phases"] = dict(profiler.times)
+    return result
+
+def run_benchmarks(sizes, densities, minority_pcs, homophilies, steps, phases=False):
+    '''
+    Yield the result of every configuration as it finishes.
+    '''
+    for size, density, minority_pc, homophily in itertools.product(sizes, densities, minority_pcs, homophilies):
+        # one fresh process per configuration, for a clean peak memory measurement
+        with ProcessPoolExecutor(1) as executor:
+            yield executor.submit(benchmark_config, size, density, minority_pc, homophily, steps, phases).result()
+
+def _key(result):
+    return (result["size"], result["density"], result["minority_pc"], result["homophily"])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark VirtuousEmotivistModel construction and stepping.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[25, 50, 100, 200, 500])
+    parser.add_argument("--densities", type=float, nargs="+", default=[DEFAULT_PARAMS["density"], 0.95])
+    parser.add_argument("--minority-pcs", type=float, nargs="+", default=[DEFAULT_PARAMS["minority_pc"]])
+    parser.add_argument("--homophilies", type=int, nargs="+", default=[DEFAULT_PARAMS["homophily"]])
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--phases", action="store_true", help="time the phases of each step")
+    parser.add_argument("--events", action="store_true", help="print the mean event counts per step")
+    parser.add_argument("--output", help="save the results as JSON, e.g. as a baseline")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare steps/sec with")
+    cli_args = parser.parse_args()
+    baseline = {}
+    if cli_args.compare:
+        with open(cli_args.compare) as f:
+            baseline = {_key(result): result for result in json.load(f)}
+    results = []
+    print("{:>5} {:>7} {:>8} {:>9} {:>7} {:>11} {:>10} {:>9}".format("size", "density", "minority", "homophily", "agents"
+        , "construct s", "steps/s", "peak MB") + ("   speedup" if baseline else ""))
+    for result in run_benchmarks(cli_args.sizes, cli_args.densities, cli_args.minority_pcs, cli_args.homophilies
+            , cli_args.steps, cli_args.phases):
+        results.append(result)
+        line = "{size:>5} {density:>7} {minority_pc:>8} {homophily:>9} {agents:>7} {construct_s:>11.3f} {steps_per_s:>10.2f} {peak_mb:>9.1f}".format(**result)
+        if _key(result) in baseline:
+            line += " {:>9.2f}x".format(result["steps_per_s"] / baseline[_key(result)]["steps_per_s"])
+        print(line)
+        if cli_args.events:
+            print("      " + ", ".join("{} {:.1f}".format(name, count) for name, count in result["events"].items()))
+        if cli_args.phases:
+            total = sum(result["phases"].values()) or 1.0
+            for phase, seconds in sorted(result["phases"].items(), key=lambda item: -item[1]):
+                print("      {:<22} {:6.1f} %".format(phase, 100*seconds/total))
+        sys.stdout.flush()
+    if cli_args.output:
+        with open(cli_args.output, "w") as f:
+            json.dump(results, f, indent=1)
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+import mesa
+import numpy as np
+
+from checkpoint import checkpoint, restore
+from collector import MODEL_REPORTERS
+from convergence import SteadyStateDetector
+from model import VirtuousEmotivistModel
+
+'''
+Persistent result cache for runs of the "Virtuous-Emotivist segregating opinion transfer model".
+
+ResultCache.run(args, num_steps) returns the recorded time series of a run: every model-level
+count and event count of collector.MODEL_REPORTERS and "belief_count:<belief>" (agents whose
+strongest belief it is), as arrays indexed by step. Runs are stored on disk under a hash of the
+model arguments (seed included), the random and initialization backends, the steady state
+settings, the code version (the source of the modules that decide a run's outcome and what is
+stored of it) and whether events are counted (not under python -O), together with a checkpoint
+of the final state. Running the same configuration again reads it back, and
+asking for more steps continues the stored run from its checkpoint instead of starting over
+(checkpoint.restore continues exactly like the original run would have). The least recently
+used entries are evicted once the cache grows beyond max_bytes:
+
+    cache = ResultCache("runs.cache", max_bytes=2**30)
+    series = cache.run(args, 200) # reuses a cached 100-step run of args, if any
+    series["virtuous_count"][100]
+
+Sweeps use it with "cache": {"path": "runs.cache", "max_mb": 1024} in the spec (see sweep.py).
+'''
+
+# modules whose source decides the outcome of a run or what is stored of it
+CODE_FILES = ["model.py", "grid.py", "neighborhood.py", "initialization.py", "rng.py", "convergence.py", "checkpoint.py"
+    , "collector.py", "cache.py"]
+
+_code_version = None
+
+def code_version():
+    '''
+    Hash of the model source (CODE_FILES) and mesa version, computed once per process.
+    '''
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256(mesa.__version__.encode())
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in CODE_FILES:
+            with open(os.path.join(directory, name), "rb") as f:
+                digest.update(f.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+def _canonical(value):
+    # numbers compare by value (2 and 2.0 give the same key), strings as they are
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+def cache_key(args, rng_backend="python", init_backend="python", steady_state=None):
+    '''
+    Canonical hash of a run configuration: model arguments (seed included), backends, steady
+    state settings (keyword arguments of convergence.SteadyStateDetector), code version and
+    __debug__ (event counts are all zero under python -O).
+    '''
+    config = {"args": [_canonical(value) for value in args], "rng_backend": rng_backend, "init_backend": init_backend
+        , "steady_state": steady_state, "code": code_version(), "debug": __debug__}
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+class SeriesCollector:
+    '''
+    Collector of the time series a cache entry stores, indexed by step, continuing series if
+    given. Steps already recorded (e.g. the step a run is restored at) are kept as they are.
+    '''
+    def __init__(self, series=None):
+        self.series = {name: list(values) for name, values in (series or {}).items()}
+
+    def collect(self, model):
+        if not self.series:
+            self.series = {name: [] for name in MODEL_REPORTERS + ["belief_count:" + belief for belief in model.population]}
+        step = model.schedule.steps
+        if (step < len(self.series[MODEL_REPORTERS[0]])):
+            return
+        for name in MODEL_REPORTERS:
+            self.series[name].append(getattr(model, name))
+        counts = model.grid.neighborhood.belief_counts
+        for code, belief in enumerate(model.population):
+            self.series["belief_count:" + belief].append(sum(type_counts[code] for type_counts in counts))
+
+    def arrays(self, num_steps):
+        return {name: np.array(values[:num_steps+1], dtype=np.int64) for name, values in self.series.items()}
+
+class ResultCache:
+    '''
+    Directory of cached runs, one pickle file per configuration, bounded to max_bytes with least
+    recently used eviction (by file modification time, refreshed on every hit). Safe to share
+    between processes: entries are written to a temporary file and renamed into place.
+    '''
+    def __init__(self, path, max_bytes=2**30):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, key + ".pkl")
+
+    def get(self, key):
+        '''
+        The stored entry of key (a dict of "steps", "series", "state" and "steady_state"), or None.
+        '''
+        try:
+            with open(self._file(key), "rb") as f:
+                entry = pickle.load(f)
+            os.utime(self._file(key)) # most recently used
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        return entry
+
+    def put(self, key, entry):
+        fd, temporary = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self._file(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self.evict()
+
+    def evict(self):
+        '''
+        Remove the least recently used entries until the cache fits in max_bytes.
+        '''
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(".pkl"):
+                try:
+                    stat = os.stat(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if (total <= self.max_bytes):
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def run(self, args, num_steps, rng_backend="python", init_backend="python", steady_state=None):
+        '''
+        Time series (see the module docstring) of the run of VirtuousEmotivistModel(*args) up to
+        step num_steps, from the cache if possible. steady_state is a dict of
+        convergence.SteadyStateDetector arguments, or None.
+        '''
+        key = cache_key(args, rng_backend, init_backend, steady_state)
+        entry = self.get(key)
+        if entry is not None and entry["steps"] >= num_steps:
+            return {name: values[:num_steps+1] for name, values in entry["series"].items()}
+        if entry is not None:
+            # continue the stored run
+            collector = SeriesCollector(entry["series"])
+            model = restore(entry["state"], collect_agent_vars=False, collector=collector, steady_state=entry["steady_state"])
+        else:
+            detector = None if steady_state is None else SteadyStateDetector(**steady_state)
+            collector = SeriesCollector()
+            model = VirtuousEmotivistModel(*args, collect_agent_vars=False, collector=collector, rng_backend=rng_backend
+                , steady_state=detector, init_backend=init_backend)
+        model.run_to(num_steps)
+        series = collector.arrays(num_steps)
+        self.put(key, {"steps": num_steps, "series": series, "state": checkpoint(model), "steady_state": model.steady_state})
+        return series
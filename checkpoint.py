@@ -0,0 +1,147 @@
+import pickle
+
+import numpy as np
+
+from model import VirtuousEmotivistModel, EmotivistAgent, VirtuousAgent
+
+'''
+Checkpoints of VirtuousEmotivistModel runs.
+
+checkpoint(model) captures the full state of a model as a dict of NumPy arrays and plain values:
+agent arrays in schedule order (id, type, position, beliefs, power, determination, life force,
+happy, convinced), the order of the empty cells, the model-level counters, last_agent_id, the
+step count, the random stream state and the model-level datacollector history.
+restore(state) rebuilds an identical model that continues exactly like the original, and
+fork(state, seed, **changes) gives an independent continuation with a new seed and, optionally,
+changed step parameters. A shared initialization and burn-in then only has to run once:
+
+    burn_in = VirtuousEmotivistModel(*args)
+    burn_in.run_to(100)
+    state = checkpoint(burn_in)
+    runs = [fork(state, seed, convert_prob=p) for seed, p in ...]
+
+Agent-level datacollector history and any collector or steady_state detector are not part of
+a checkpoint; pass new ones to restore/fork.
+'''
+
+EMOTIVIST = 0 # as the "type" agent reporter
+VIRTUOUS = 1
+COUNTERS = ["happy", "convinced", "virtuous_count", "emotivist_count", "virtuous_death_count", "last_agent_id", "changes"]
+# parameters that only affect later steps, so they can be changed in a fork
+FORKABLE = ["homophily", "virtuous_homophily", "nudge_amount", "num_to_argue", "num_to_convert", "convert_prob"
+    , "convinced_threshold", "random_move_prob", "traditionless_life_decrease", "strongest_belief_weight"
+    , "emo_bias_a", "emo_bias_b", "emo_bias_c"]
+ARG_INDEX = {"init_seed": 0, "density": 3, "homophily": 5, "virtuous_homophily": 6, "nudge_amount": 7, "num_to_argue": 8
+    , "num_to_convert": 9, "convert_prob": 10, "convinced_threshold": 11, "random_move_prob": 12
+    , "traditionless_life_decrease": 13, "emo_bias_a": 20, "emo_bias_b": 21, "emo_bias_c": 22, "strongest_belief_weight": 23}
+
+def checkpoint(model):
+    '''
+    Full state of model as a dict.
+    '''
+    agents = model.schedule.agents
+    state = {
+        "model_args": tuple(model.model_args),
+        "rng_backend": model.rng_backend,
+        "rng_state": model.random.getstate(),
+        "steps": model.schedule.steps,
+        "time": model.schedule.time,
+        "running": model.running,
+        "message": model.message,
+        "model_vars": {name: list(values) for name, values in model.datacollector.model_vars.items()},
+        "id": np.array([agent.unique_id for agent in agents], dtype=np.int64),
+        "type": np.array([EMOTIVIST if isinstance(agent, EmotivistAgent) else VIRTUOUS for agent in agents], dtype=np.int8),
+        "pos": np.array([agent.pos for agent in agents], dtype=np.int32).reshape(-1, 2),
+        "beliefs": np.array([agent.beliefs for agent in agents]).reshape(-1, len(model.population)),
+        "power": np.array([agent.power for agent in agents]),
+        "determination": np.array([agent.determination for agent in agents]),
+        "life_force": np.array([getattr(agent, "life_force", 1.0) for agent in agents]),
+        "happy": np.array([agent.happy for agent in agents], dtype=bool),
+        "convinced": np.array([agent.convinced for agent in agents], dtype=bool),
+        "empties": np.array(model.grid.empties, dtype=np.int32).reshape(-1, 2),
+    }
+    state["counters"] = {name: getattr(model, name) for name in COUNTERS}
+    return state
+
+def restore(state, **options):
+    '''
+    Rebuild the model of a checkpoint. options are VirtuousEmotivistModel keyword arguments
+    (collect_agent_vars, collector, steady_state); rng_backend is taken from the checkpoint.
+    '''
+    collector = options.pop("collector", None)
+    args = list(state["model_args"])
+    empty_args = list(args)
+    empty_args[ARG_INDEX["density"]] = 0.0 # set up an empty grid, the agents come from the checkpoint
+    model = VirtuousEmotivistModel(*empty_args, rng_backend=state["rng_backend"], **options)
+    model.model_args = tuple(args)
+    model.density = args[ARG_INDEX["density"]]
+    model.random.setstate(state["rng_state"])
+    model.schedule.steps = state["steps"]
+    model.schedule.time = state["time"]
+    model.running = state["running"]
+    model.message = state["message"]
+    for name, value in state["counters"].items():
+        setattr(model, name, value)
+    # series missing from older checkpoints (e.g. event counts) start empty
+    model.datacollector.model_vars = {name: list(state["model_vars"].get(name, [])) for name in model.datacollector.model_vars}
+    model.datacollector.agent_vars = {name: [] for name in model.datacollector.agent_vars}
+
+    bias = [args[ARG_INDEX["emo_bias_" + belief.lower()]] for belief in model.population]
+    for i in range(len(state["id"])):
+        beliefs = state["beliefs"][i].tolist()
+        pos = tuple(state["pos"][i].tolist())
+        if (state["type"][i] == EMOTIVIST):
+            agent = EmotivistAgent(int(state["id"][i]), pos, model, beliefs, bias, float(state["power"][i])
+                , float(state["determination"][i]))
+        else:
+            agent = VirtuousAgent(int(state["id"][i]), pos, model, beliefs, float(state["life_force"][i]))
+        agent.happy = bool(state["happy"][i])
+        agent.convinced = bool(state["convinced"][i])
+        model.grid._place_agent(pos, agent)
+        model.schedule.add(agent)
+    # same empty cell order as the original, so find_empty draws the same cells
+    model.grid.empties = [tuple(pos) for pos in state["empties"].tolist()]
+    model.grid.empty_index = {pos: i for i, pos in enumerate(model.grid.empties)}
+
+    model.collector = collector
+    if collector is not None:
+        collector.collect(model)
+    return model
+
+def fork(state, seed, **changes):
+    '''
+    Restore a checkpoint with its random stream reseeded with seed, as an independent
+    continuation. Keyword arguments in FORKABLE change that parameter from now on; the others
+    are passed to restore.
+    '''
+    options = {name: value for name, value in changes.items() if name not in FORKABLE}
+    changes = {name: value for name, value in changes.items() if name in FORKABLE}
+    for name in options:
+        if name in ARG_INDEX:
+            raise ValueError("Parameter " + name + " can not be changed in a fork")
+    model = restore(state, **options)
+    model.random.seed(seed)
+    args = list(model.model_args)
+    args[ARG_INDEX["init_seed"]] = seed
+    for name, value in changes.items():
+        args[ARG_INDEX[name]] = value
+        if name.startswith("emo_bias_"):
+            # emotivists share one bias list
+            for agent in model.schedule.agents:
+                if isinstance(agent, EmotivistAgent):
+                    agent.bias[model.population.index(name[-1].upper())] = value
+                    break
+        elif name == "strongest_belief_weight":
+            model.set_strongest_belief_weight(value)
+        else:
+            setattr(model, name, value)
+    model.model_args = tuple(args)
+    return model
+
+def save(state, path):
+    with open(path, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
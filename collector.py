@@ -0,0 +1,115 @@
+import numpy as np
+
+from model import EmotivistAgent, EVENTS
+
+'''
+Columnar data collector for the "Virtuous-Emotivist segregating opinion transfer model".
+
+mesa's DataCollector appends one Python tuple per agent per reporter per step, including the
+formatted beliefs_string(), so a 300-step run builds hundreds of thousands of tuples that are
+mostly never read. ColumnarCollector instead writes the agent state into NumPy arrays that are
+allocated once for the whole run, indexed by sample and grid cell:
+
+    type             int8     0 emotivist, 1 virtuous (as the "type" agent reporter), -1 empty
+    strongest_belief int8     index into model.population, -1 empty
+    beliefs          float32  one value per belief in model.population
+    happy, convinced bool
+
+and the model-level counts and event counts of the step (model.EVENTS) as int32 columns.
+Only every "interval"-th step is sampled (the
+last step is always sampled), or only the last step with final_only=True.
+'''
+
+AGENT_REPORTERS = ["type", "strongest_belief", "beliefs", "happy", "convinced"]
+MODEL_REPORTERS = ["happy", "convinced", "emotivist_count", "virtuous_count", "virtuous_death_count"] + EVENTS
+
+class ColumnarCollector:
+    '''
+    Collect "reporters" (a subset of AGENT_REPORTERS) from a model run of num_steps steps,
+    at the steps in sample_steps if given.
+    Pass it to VirtuousEmotivistModel(..., collector=collector), the model calls collect()
+    after setup and after every step.
+    '''
+    def __init__(self, num_steps, interval=1, reporters=AGENT_REPORTERS, final_only=False, sample_steps=None):
+        for name in reporters:
+            if name not in AGENT_REPORTERS:
+                raise ValueError("Unknown agent reporter: " + str(name))
+        self.num_steps = num_steps
+        self.interval = interval
+        self.reporters = list(reporters)
+        self.final_only = final_only
+        if sample_steps is not None:
+            self.steps = np.unique(sample_steps)
+        elif final_only:
+            self.steps = np.array([num_steps])
+        else:
+            self.steps = np.union1d(np.arange(0, num_steps+1, interval), [num_steps])
+        self.samples = 0
+        self.model_vars = {name: np.zeros(len(self.steps), dtype=np.int32) for name in MODEL_REPORTERS}
+        self.agent_vars = None # allocated on the first collect, when the grid size is known
+        self.population = None
+
+    def allocate(self, model):
+        self.population = model.population
+        shape = (len(self.steps), model.height, model.width) # SingleGrid(height, width): x in range(height)
+        dtypes = {"type": np.int8, "strongest_belief": np.int8, "happy": bool, "convinced": bool}
+        self.agent_vars = {}
+        for name in self.reporters:
+            if (name == "beliefs"):
+                self.agent_vars[name] = np.zeros(shape + (len(model.population),), dtype=np.float32)
+            else:
+                self.agent_vars[name] = np.zeros(shape, dtype=dtypes[name])
+        for name in ("type", "strongest_belief"):
+            if name in self.agent_vars:
+                self.agent_vars[name].fill(-1)
+
+    def collect(self, model):
+        '''
+        Record the model if its current step is sampled.
+        '''
+        step = model.schedule.steps
+        while (self.samples < len(self.steps) and self.steps[self.samples] < step):
+            self.samples += 1 # steps before a restored checkpoint stay empty
+        if (self.samples >= len(self.steps) or step != self.steps[self.samples]):
+            return
+        if self.agent_vars is None:
+            self.allocate(model)
+        row = self.samples
+        self.samples += 1
+        for name, column in self.model_vars.items():
+            column[row] = getattr(model, name)
+        if not self.agent_vars:
+            return
+
+        agents = model.schedule.agents
+        xs = [agent.pos[0] for agent in agents]
+        ys = [agent.pos[1] for agent in agents]
+        for name, column in self.agent_vars.items():
+            if (name == "type"):
+                values = [0 if isinstance(agent, EmotivistAgent) else 1 for agent in agents]
+            elif (name == "strongest_belief"):
+                values = [agent.strongest for agent in agents]
+            elif (name == "beliefs"):
+                values = [agent.beliefs for agent in agents]
+            else:
+                values = [getattr(agent, name) for agent in agents]
+            column[row, xs, ys] = values
+
+    def get_model_vars(self, name):
+        '''
+        Values of a model-level count at the sampled steps collected so far.
+        '''
+        return self.model_vars[name][:self.samples]
+
+    def get_agent_vars(self, name):
+        '''
+        Array of shape (samples, height, width) (plus the belief axis for "beliefs") of an
+        agent-level reporter at the sampled steps collected so far.
+        '''
+        return self.agent_vars[name][:self.samples]
+
+    def belief_count(self, belief, sample=-1):
+        '''
+        Number of agents whose strongest belief is "belief" at a sample (the last one by default).
+        '''
+        return int(np.count_nonzero(self.get_agent_vars("strongest_belief")[sample] == self.population.index(belief)))
@@ -0,0 +1,74 @@
+from collections import deque
+
+import numpy as np
+
+from neighborhood import HAPPY
+
+'''
+Steady-state detection for the "Virtuous-Emotivist segregating opinion transfer model".
+
+Many runs settle long before the requested number of steps: the virtuous agents die out, or the
+numbers of virtuous agents and emotivists stop changing while agents keep arguing and moving
+among themselves. SteadyStateDetector watches the outcome counts of a running model and tells it
+to stop (VirtuousEmotivistModel(..., steady_state=detector)), and VirtuousEmotivistModel.run_to
+carries the final state forward for the remaining steps.
+'''
+
+# outcome counts watched by default; happy and convinced keep fluctuating in settled runs
+COUNTS = ["virtuous_count", "emotivist_count"]
+VIRTUOUS = 1 # type code of virtuous agents in the neighborhood arrays
+
+def unhappy_virtuous(model):
+    '''
+    Number of unhappy virtuous agents, which lose life force and may die later.
+    '''
+    neighborhood = model.grid.neighborhood
+    types = np.frombuffer(neighborhood.types, dtype=np.uint8)
+    flags = np.frombuffer(neighborhood.flags, dtype=np.uint8)
+    return int(np.count_nonzero((types == VIRTUOUS) & (flags & HAPPY == 0)))
+
+class SteadyStateDetector:
+    '''
+    Reports a steady state once
+      - there are no virtuous agents left, an absorbing state (only virtuous agents convert
+        emotivists or die), or
+      - nothing happened for "window" steps (no moves, belief nudges, conversions or deaths,
+        model.changes == 0), or
+      - if tolerance is not None, every count in "counts" stayed within tolerance of its range
+        over the last "window" steps, and every virtuous agent was happy all along (an unhappy
+        one loses life force for up to hundreds of steps before it dies, so the counts can stay
+        flat for a long time before they drop).
+    settled_at is the step it first reported a steady state at, or None.
+    '''
+    def __init__(self, window=20, tolerance=0, counts=COUNTS):
+        self.window = window
+        self.tolerance = tolerance
+        self.counts = list(counts)
+        self.quiet_steps = 0
+        self.history = deque(maxlen=window+1)
+        self.settled_at = None
+
+    def update(self, model):
+        '''
+        Record the step the model just ran, and return True if it is in a steady state.
+        '''
+        if self._settled(model):
+            if self.settled_at is None:
+                self.settled_at = model.schedule.steps
+            return True
+        return False
+
+    def _settled(self, model):
+        if (model.virtuous_count == 0):
+            return True
+        self.quiet_steps = self.quiet_steps + 1 if model.changes == 0 else 0
+        if (self.quiet_steps >= self.window):
+            return True
+        if self.tolerance is None:
+            return False
+        self.history.append([getattr(model, name) for name in self.counts] + [unhappy_virtuous(model)])
+        if (len(self.history) <= self.window):
+            return False
+        if any(values[-1] > 0 for values in self.history):
+            return False
+        return all(max(values) - min(values) <= self.tolerance for values in zip(*self.history))
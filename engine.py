@@ -0,0 +1,508 @@
+import numpy as np
+
+from mesa.datacollection import DataCollector
+
+from neighborhood import torus_neighbor_table # cached per grid shape
+from initialization import sample_agents
+
+'''
+Vectorized stepping engine for the "Virtuous-Emotivist segregating opinion transfer model".
+
+The grid is stored as flat NumPy arrays of length height*width (cell index = x*width + y, with
+x in range(height) as in model.py) and every step is run as batched array operations instead of
+calling EmotivistAgent.step / VirtuousAgent.step one agent at a time.
+
+All arrays carry a leading replica axis, so one step advances many independent grids at once
+(VirtuousEmotivistEnsemble, run_ensemble). VectorizedVirtuousEmotivistModel is a single replica.
+
+Agents are activated in a few random groups per step (see step_grid) instead of one at a time,
+so runs are statistically (not bit-for-bit) equivalent to VirtuousEmotivistModel.
+Use compare_engines() to check this for a parameter set.
+'''
+
+EMPTY = -1
+EMOTIVIST = 0 # same codes as the "type" agent reporter in model.py
+VIRTUOUS = 1
+
+DONE = -1 # activation group of agents that already acted this step
+
+def array_layout(replicas, cells, n_beliefs):
+    '''
+    (name, shape, dtype) of every GridState array.
+    '''
+    return [("agent_type", (replicas, cells), np.int8), ("strongest", (replicas, cells), np.int8)
+        , ("beliefs", (replicas, cells, n_beliefs), np.float64), ("power", (replicas, cells), np.float64)
+        , ("determination", (replicas, cells), np.float64), ("life_force", (replicas, cells), np.float64)
+        , ("happy", (replicas, cells), bool), ("convinced", (replicas, cells), bool), ("group", (replicas, cells), np.int16)]
+
+class GridState:
+    '''
+    Per-cell agent arrays for a batch of replicas, shape (replicas, cells[, beliefs]).
+    Empty cells have agent_type EMPTY and zeros elsewhere. The arrays are only ever updated
+    in place, so flat() views over all replicas stay valid.
+    arrays optionally gives the arrays to use, as they are (a dict by name, shaped as in
+    array_layout, e.g. views of shared memory).
+    '''
+    def __init__(self, replicas, height, width, n_beliefs, arrays=None):
+        cells = height*width
+        self.replicas = replicas
+        self.height = height
+        self.width = width
+        self.cells = cells
+        self.n_beliefs = n_beliefs
+        if arrays is None:
+            arrays = {name: np.zeros(shape, dtype=dtype) for name, shape, dtype in array_layout(replicas, cells, n_beliefs)}
+            arrays["agent_type"].fill(EMPTY)
+            arrays["group"].fill(DONE)
+        for name, value in arrays.items():
+            setattr(self, name, value)
+        self.neighbors = torus_neighbor_table(height, width)
+
+    def agent_arrays(self):
+        return [self.agent_type, self.strongest, self.beliefs, self.power, self.determination
+            , self.life_force, self.happy, self.convinced, self.group]
+
+    def flat(self, arr):
+        # view indexed by replica*cells + cell
+        return arr.reshape((self.replicas*self.cells,) + arr.shape[2:])
+
+    def clear(self, idx):
+        '''
+        Empty the cells at flat indices idx.
+        '''
+        for arr in self.agent_arrays():
+            self.flat(arr)[idx] = 0
+        self.flat(self.agent_type)[idx] = EMPTY
+
+    def relocate(self, movers, rngs):
+        '''
+        Move the agents at the sorted flat indices "movers" to random empty cells of their replica.
+        Cells vacated by movers are available to other movers, as in sequential move_to_empty calls.
+        Returns a flat mask of the cells the movers ended up in.
+        '''
+        cells = self.cells
+        moved = np.zeros(self.replicas*cells, dtype=bool)
+        if (movers.size == 0):
+            return moved
+        num_movers = np.bincount(movers // cells, minlength=self.replicas)
+        # only replicas with movers take part, so a replica draws the same numbers alone or in a batch
+        pool_mask = (self.agent_type == EMPTY) & (num_movers > 0)[:, None]
+        pool_mask = pool_mask.reshape(-1)
+        pool_mask[movers] = True
+        pool = np.flatnonzero(pool_mask)
+        pool_replica = pool // cells
+        # shuffle the pool within each replica and give its first cells to that replica's movers
+        keys = _draw(rngs, np.bincount(pool_replica, minlength=self.replicas), 1)[:, 0]
+        pool = pool[np.lexsort((keys, pool_replica))]
+        rank = np.arange(pool.size) - np.searchsorted(pool_replica, pool_replica)
+        dest = pool[rank < num_movers[pool_replica]]
+        values = [self.flat(arr)[movers] for arr in self.agent_arrays()] # fancy indexing copies
+        self.clear(movers)
+        for arr, vals in zip(self.agent_arrays(), values):
+            self.flat(arr)[dest] = vals
+        moved[dest] = True
+        return moved
+
+def _draw(rngs, counts, width):
+    '''
+    (sum(counts), width) uniform draws in one call per replica, the rows of replica r taken from rngs[r].
+    '''
+    draws = np.empty((counts.sum(), width))
+    start = 0
+    for rng, count in zip(rngs, counts):
+        if (count > 0):
+            draws[start:start+count] = rng.random((count, width))
+            start += count
+    return draws
+
+def _rows_draw(rngs, rows_replica, width):
+    # draws for rows sorted by replica
+    return _draw(rngs, np.bincount(rows_replica, minlength=len(rngs)), width)
+
+def _random_subset(mask, limit, rows_replica, rngs):
+    '''
+    Keep at most limit[i] randomly chosen True entries in each row i of mask.
+    '''
+    over = np.flatnonzero(mask.sum(axis=1) > limit)
+    if (over.size == 0):
+        return mask
+    keys = _rows_draw(rngs, rows_replica[over], mask.shape[1])
+    ranked = np.where(mask[over], keys, 2.0).argsort(axis=1).argsort(axis=1)
+    mask = mask.copy()
+    mask[over] &= ranked < limit[over, None]
+    return mask
+
+def step_grid(state, params, rngs, groups=1):
+    '''
+    Advance every replica in "state" by one step.
+
+    params maps the model's scalar parameters (homophily, virtuous_homophily, nudge_amount,
+    num_to_argue, num_to_convert, convert_prob, convinced_threshold, random_move_prob,
+    traditionless_life_decrease, strongest_belief_weight) to arrays of shape (replicas,),
+    and "bias" to an array of shape (replicas, n_beliefs).
+
+    Agents are split at random into "groups" activation groups that act one after another,
+    each group seeing the moves and conversions of the groups before it. groups=1 is fully
+    synchronous; more groups come closer to RandomActivation.
+    Returns the number of virtuous agents that died in each replica.
+    '''
+    state.group[...] = np.stack([rng.integers(groups, size=state.cells, dtype=np.int16) for rng in rngs])
+    deaths = np.zeros(state.replicas, dtype=int)
+    for g in range(groups):
+        deaths += _activate(state, params, rngs, g)
+    return deaths
+
+def _activate(state, params, rngs, g):
+    '''
+    Run the agents of activation group g simultaneously, see step_grid.
+    '''
+    cells = state.cells
+    agent_type = state.flat(state.agent_type)
+    group = state.flat(state.group)
+
+    active = np.flatnonzero((group == g) & (agent_type != EMPTY))
+    if (active.size == 0):
+        return np.zeros(state.replicas, dtype=int)
+    draws = _rows_draw(rngs, active // cells, 1 + 8*2)
+
+    # random moving; movers take their group along, so every replica keeps its rows of draws
+    randomly_moved = state.relocate(active[draws[:, 0] < params["random_move_prob"][active // cells]], rngs)
+    active = np.flatnonzero((group == g) & (agent_type != EMPTY))
+    return interact(state, params, rngs, active, draws[:, 1:].reshape(active.size, 2, 8), randomly_moved)
+
+def interact(state, params, rngs, active, draws, randomly_moved):
+    '''
+    The rest of the step of the agents at the sorted flat indices "active", after random moving:
+    arguments, strengthening, conversions, happiness, life force, deaths, and moving (through
+    state.relocate) the unhappy agents that did not move at random (flat mask randomly_moved)
+    and the converted ones. draws are uniforms of shape (active.size, 2, 8).
+    Returns the number of virtuous agents that died in each replica.
+    '''
+    n_beliefs = state.n_beliefs
+    cells = state.cells
+    agent_type = state.flat(state.agent_type)
+    group = state.flat(state.group)
+    strongest = state.flat(state.strongest)
+    beliefs = state.flat(state.beliefs)
+    power = state.flat(state.power)
+    determination = state.flat(state.determination)
+    life_force = state.flat(state.life_force)
+
+    rep = active // cells
+    nb = (rep*cells)[:, None] + state.neighbors[active % cells] # flat indices of the 8 neighbors
+    own_type = agent_type[active]
+    own = strongest[active].astype(np.intp)
+    own_belief = beliefs[active, own]
+    nb_type = agent_type[nb]
+    nb_strongest = strongest[nb]
+    own_column = np.broadcast_to(own[:, None], nb.shape)
+
+    # emotivists argue with up to num_to_argue emotivist neighbors
+    emo_neighbors = (own_type == EMOTIVIST)[:, None] & (nb_type == EMOTIVIST)
+    similar_emo = emo_neighbors.sum(axis=1)
+    argue = _random_subset(emo_neighbors, params["num_to_argue"][rep], rep, rngs)
+    argue &= draws[:, 0] < params["bias"][rep, own][:, None]
+    target = nb[argue]
+    suggested = own_column[argue]
+    target_strongest = strongest[target]
+    success = ~((target_strongest == suggested) & (beliefs[target, target_strongest] >= 1.0)) # already convinced
+    target = target[success]
+    suggested = suggested[success]
+    source_amount = np.broadcast_to((params["nudge_amount"][rep]*power[active])[:, None], nb.shape)
+    amount = source_amount[argue][success]*(1 - determination[target])
+
+    # virtuous agents strengthen neighbors of the same tradition
+    same_tradition = (own_type == VIRTUOUS)[:, None] & (nb_type == VIRTUOUS) & (nb_strongest == own[:, None])
+    similar_vir = same_tradition.sum(axis=1)
+    # as in strenghten_tradition, the check for "already convinced" is done on the strengthening agent
+    strengthen = same_tradition & (own_belief < 1.0)[:, None]
+    target = np.concatenate([target, nb[strengthen]])
+    suggested = np.concatenate([suggested, own_column[strengthen]])
+    amount = np.concatenate([amount, np.broadcast_to(params["nudge_amount"][rep][:, None], nb.shape)[strengthen]])
+
+    # virtuous agents try to convert emotivist neighbors, at most num_to_convert successes each
+    attempts = (own_type == VIRTUOUS)[:, None] & (nb_type == EMOTIVIST) \
+        & (draws[:, 1] < params["convert_prob"][rep][:, None])
+    conversions = _random_subset(attempts, params["num_to_convert"][rep], rep, rngs)
+    # an emotivist converted by several neighbors takes the tradition of one of them at random
+    converting = np.flatnonzero(conversions.any(axis=1))
+    keys = np.zeros(conversions.shape)
+    keys[converting] = _rows_draw(rngs, rep[converting], 8)
+    order = np.argsort(keys[conversions])
+    converted, first = np.unique(nb[conversions][order], return_index=True)
+    converter_belief = own_column[conversions][order][first]
+
+    # apply belief nudges, always normalizing to 1.0
+    np.add.at(beliefs.reshape(-1), target*n_beliefs + suggested, amount*(1 + 1.0/(n_beliefs-1)))
+    for b in range(n_beliefs):
+        np.add.at(beliefs.reshape(-1), target*n_beliefs + b, amount*(-1.0/(n_beliefs-1)))
+
+    is_converted = np.zeros(agent_type.size, dtype=bool)
+    is_converted[converted] = True
+    acting = ~is_converted[active]
+    acted = active[acting]
+    rep = rep[acting]
+    own = own[acting]
+    virtuous = own_type[acting] == VIRTUOUS
+    similar_vir = similar_vir[acting]
+
+    # happiness and conviction, judged on the strongest belief at the start of the agent's step
+    happy = np.where(virtuous, similar_vir >= params["virtuous_homophily"][rep], similar_emo[acting] >= params["homophily"][rep])
+    state.flat(state.happy)[acted] = happy
+    state.flat(state.convinced)[acted] = beliefs[acted, own] >= params["convinced_threshold"][rep]
+
+    # life force of virtuous agents
+    decrease = params["traditionless_life_decrease"][rep]
+    life = life_force[acted]
+    life = np.where(virtuous & ~happy, life - decrease / (similar_vir+1), life)
+    life = np.where(virtuous & happy & (life < 1.0), life + decrease*similar_vir, life)
+    life_force[acted] = life
+    group[acted] = DONE
+
+    # replace converted emotivists with new virtuous agents, which do not act until the next step
+    weight = params["strongest_belief_weight"][converted // cells]
+    beliefs[converted] = ((1 - weight) / (n_beliefs-1))[:, None]
+    beliefs[converted, converter_belief] = weight
+    agent_type[converted] = VIRTUOUS
+    power[converted] = 1.0
+    determination[converted] = 0.0
+    life_force[converted] = 1.0
+    state.flat(state.happy)[converted] = False
+    state.flat(state.convinced)[converted] = False
+    group[converted] = DONE
+    touched = np.concatenate([target, converted])
+    strongest[touched] = beliefs[touched].argmax(axis=1)
+
+    # if life is too low, die
+    dying = virtuous & (life < 0.0)
+    state.clear(acted[dying])
+
+    # unhappy agents move; converted agents are placed in a random empty cell like
+    # SingleGrid.position_agent(agent, pos) does in VirtuousAgent.convert_emotivist
+    moving = ~dying & ~happy & ~randomly_moved[acted]
+    state.relocate(np.sort(np.concatenate([acted[moving], converted])), rngs)
+    return np.bincount(acted[dying] // cells, minlength=state.replicas)
+
+def initial_grid(state, r, rng, density, minority_pc, probs_virtuous, probs_emotivist, strongest_belief_weight, extras):
+    '''
+    Fill replica r of state like VirtuousEmotivistModel.__init__ does.
+    extras is a list of (belief index, count, power, determination) in order of precedence.
+    '''
+    n_beliefs = state.n_beliefs
+    cells = state.height*state.width
+    occupied, num_virtuous, beliefs_of, power, determination = sample_agents(rng, cells, density, minority_pc
+        , probs_virtuous, probs_emotivist, extras)
+    state.clear(np.arange(cells) + r*cells)
+    state.agent_type[r, occupied] = np.where(np.arange(occupied.size) < num_virtuous, VIRTUOUS, EMOTIVIST)
+    state.beliefs[r, occupied] = (1-strongest_belief_weight)/(n_beliefs-1)
+    state.beliefs[r, occupied, beliefs_of] = strongest_belief_weight
+    state.power[r, occupied] = power
+    state.determination[r, occupied] = determination
+    state.life_force[r, occupied[:num_virtuous]] = 1.0
+    state.strongest[r] = np.where(state.agent_type[r] != EMPTY, state.beliefs[r].argmax(axis=1), 0)
+
+# argument names of VirtuousEmotivistModel, in order
+PARAM_NAMES = ["init_seed", "height", "width", "density", "minority_pc", "homophily", "virtuous_homophily", "nudge_amount"
+    , "num_to_argue", "num_to_convert", "convert_prob", "convinced_threshold", "random_move_prob", "traditionless_life_decrease"
+    , "vir_a", "vir_b", "vir_c", "emo_a", "emo_b", "emo_c", "emo_bias_a", "emo_bias_b", "emo_bias_c", "strongest_belief_weight"
+    , "count_extra_pow", "count_extra_det", "count_extra_det_pow", "extra_pow", "extra_det", "belief_of_extra_pow"
+    , "belief_of_extra_det", "belief_of_extra_det_pow"]
+# parameters used by step_grid, one value per replica
+STEP_PARAMS = ["homophily", "virtuous_homophily", "nudge_amount", "num_to_argue", "num_to_convert", "convert_prob"
+    , "convinced_threshold", "random_move_prob", "traditionless_life_decrease", "strongest_belief_weight"]
+OUTPUTS = ["happy", "convinced", "virtuous_count", "emotivist_count", "virtuous_death_count"]
+
+def init_replica(state, params, r, rng, population, run):
+    '''
+    Set up replica r of state and params from run, a dict of VirtuousEmotivistModel arguments.
+    Returns the start message of the replica.
+    '''
+    for name in STEP_PARAMS:
+        params[name][r] = run[name]
+    params["bias"][r] = [run["emo_bias_a"], run["emo_bias_b"], run["emo_bias_c"]]
+    probs_emotivist = np.array([run["emo_a"], run["emo_b"], run["emo_c"]])
+    probs_emotivist = probs_emotivist / np.sum(probs_emotivist)
+    probs_virtuous = np.array([run["vir_a"], run["vir_b"], run["vir_c"]])
+    probs_virtuous = probs_virtuous / np.sum(probs_virtuous)
+    # extra determined+powerful emotivists only get extra power, and extras of a belief not in the
+    # population are left out, as in the agent-based model
+    extras = [(population.index(belief), count, pow, det) for belief, count, pow, det in [
+        (run["belief_of_extra_det"], run["count_extra_det"], 1.0, run["extra_det"])
+        , (run["belief_of_extra_pow"], run["count_extra_pow"], run["extra_pow"], 0.0)
+        , (run["belief_of_extra_det_pow"], run["count_extra_det_pow"], run["extra_pow"], 0.0)] if belief in population]
+    initial_grid(state, r, rng, run["density"], run["minority_pc"], probs_virtuous, probs_emotivist
+        , run["strongest_belief_weight"], extras)
+    return "Emotivist probs: " + str(list(map(lambda x: "{:.2f}".format(x), probs_emotivist.tolist()))) \
+            + ", Virtuous probs: " + str(list(map(lambda x: "{:.2f}".format(x), probs_virtuous.tolist())))
+
+class VirtuousEmotivistEnsemble:
+    '''
+    Many replicas of the model held as (replicas, cells) arrays and advanced together by one
+    vectorized step. runs is a list of VirtuousEmotivistModel argument tuples (init_seed first),
+    so every replica has its own seed and parameters; all replicas must share height and width.
+    Model-level outputs are arrays with one value per replica.
+    '''
+
+    def __init__(self, runs, activation_groups=8):
+        runs = [dict(zip(PARAM_NAMES, run)) for run in runs]
+        self.height = runs[0]["height"]
+        self.width = runs[0]["width"]
+        if any(run["height"] != self.height or run["width"] != self.width for run in runs):
+            raise ValueError("All replicas of an ensemble must have the same grid size")
+        self.runs = runs
+        self.activation_groups = activation_groups
+        self.population = ["A", "B", "C"]
+        replicas = len(runs)
+        self.rngs = [np.random.default_rng(int(run["init_seed"])) for run in runs]
+        self.params = {name: np.zeros(replicas) for name in STEP_PARAMS}
+        self.params["bias"] = np.zeros((replicas, len(self.population)))
+        self.state = GridState(replicas, self.height, self.width, len(self.population))
+        self.messages = [init_replica(self.state, self.params, r, rng, self.population, run)
+            for r, (rng, run) in enumerate(zip(self.rngs, runs))]
+
+        self.steps = 0
+        self.virtuous_death_count = np.zeros(replicas, dtype=int)
+        self.model_vars = {name: [] for name in OUTPUTS}
+        self.update_counts()
+        self.collect()
+
+    def update_counts(self):
+        self.happy = np.count_nonzero(self.state.happy, axis=1)
+        self.convinced = np.count_nonzero(self.state.convinced, axis=1)
+        self.emotivist_count = np.count_nonzero(self.state.agent_type == EMOTIVIST, axis=1)
+        self.virtuous_count = np.count_nonzero(self.state.agent_type == VIRTUOUS, axis=1)
+
+    def collect(self):
+        for name in OUTPUTS:
+            self.model_vars[name].append(getattr(self, name).copy())
+
+    def get_model_vars(self, name):
+        '''
+        History of a model-level output as an array of shape (steps+1, replicas).
+        '''
+        return np.array(self.model_vars[name])
+
+    def agent_count(self):
+        return np.count_nonzero(self.state.agent_type != EMPTY, axis=1)
+
+    def belief_count(self, belief, agent_type=None):
+        '''
+        Number of agents (of agent_type EMOTIVIST or VIRTUOUS, if given) whose strongest belief is "belief".
+        '''
+        believers = (self.state.agent_type != EMPTY) & (self.state.strongest == self.population.index(belief))
+        if (agent_type is not None):
+            believers &= self.state.agent_type == agent_type
+        return np.count_nonzero(believers, axis=1)
+
+    def step(self):
+        self.virtuous_death_count += step_grid(self.state, self.params, self.rngs, self.activation_groups)
+        self.steps += 1
+        self.update_counts()
+        self.collect()
+
+    def run(self, num_steps):
+        while self.steps < num_steps:
+            self.step()
+
+def run_ensemble(runs, num_steps, outputs=OUTPUTS, batch_size=256, activation_groups=8):
+    '''
+    Run every argument tuple in runs for num_steps steps, batch_size replicas at a time, and return
+    {output: array of final values in the order of runs}. An output is the name of a model-level
+    output or a function taking the ensemble and returning one value per replica, for example
+    lambda ensemble: ensemble.belief_count("A").
+    '''
+    results = {output: [] for output in outputs}
+    for i in range(0, len(runs), batch_size):
+        ensemble = VirtuousEmotivistEnsemble(runs[i:i+batch_size], activation_groups)
+        ensemble.run(num_steps)
+        for output in outputs:
+            results[output].append(output(ensemble) if callable(output) else getattr(ensemble, output))
+    return {output: np.concatenate(values) for output, values in results.items()}
+
+class _ArraySchedule:
+    '''
+    Minimal stand-in for the mesa scheduler, for code that reads model.schedule.steps
+    and model.schedule.get_agent_count().
+    '''
+    def __init__(self, model):
+        self.model = model
+        self.steps = 0
+        self.time = 0
+
+    def get_agent_count(self):
+        return self.model.agent_count()
+
+class VectorizedVirtuousEmotivistModel:
+    '''
+    Array-based drop-in for VirtuousEmotivistModel, taking the same arguments and exposing the same
+    model-level outputs (happy, convinced, virtuous_count, emotivist_count, virtuous_death_count),
+    including a model-level datacollector. This is an ensemble with a single replica.
+    '''
+
+    def __init__(self, *model_args, activation_groups=8):
+        self.ensemble = VirtuousEmotivistEnsemble([model_args], activation_groups)
+        self.state = self.ensemble.state
+        self.height = self.ensemble.height
+        self.width = self.ensemble.width
+        self.population = self.ensemble.population
+        self.schedule = _ArraySchedule(self)
+        self.update_counts()
+        self.datacollector = DataCollector(
+            {"happy": "happy", "convinced": "convinced", "emotivist_count": "emotivist_count" \
+                , "virtuous_count": "virtuous_count", "virtuous_death_count": "virtuous_death_count"})
+        self.message = self.ensemble.messages[0]
+        self.running = True
+        self.datacollector.collect(self)
+
+    def update_counts(self):
+        for name in OUTPUTS:
+            setattr(self, name, int(getattr(self.ensemble, name)[0]))
+
+    def agent_count(self):
+        return int(self.ensemble.agent_count()[0])
+
+    def step(self):
+        self.ensemble.step()
+        self.schedule.steps += 1
+        self.schedule.time += 1
+        self.update_counts()
+        self.datacollector.collect(self)
+
+def ks_statistic(a, b):
+    '''
+    Two-sample Kolmogorov-Smirnov statistic (largest distance between the empirical CDFs).
+    '''
+    a = np.sort(np.asarray(a, dtype=float))
+    b = np.sort(np.asarray(b, dtype=float))
+    values = np.concatenate([a, b])
+    cdf_a = np.searchsorted(a, values, side="right") / float(a.size)
+    cdf_b = np.searchsorted(b, values, side="right") / float(b.size)
+    return float(np.max(np.abs(cdf_a - cdf_b)))
+
+def compare_engines(model_args, seeds, num_steps, engine=VectorizedVirtuousEmotivistModel):
+    '''
+    Statistical-equivalence check against the agent-based path: run both VirtuousEmotivistModel and
+    engine (VectorizedVirtuousEmotivistModel, or any callable taking the model arguments, e.g. a
+    tiled.TiledVirtuousEmotivistModel with set workers) for every seed with model_args (all
+    arguments after init_seed) and return {output: (agent-based values, engine values, KS statistic)}
+    at step num_steps.
+    '''
+    from model import VirtuousEmotivistModel
+    results = {}
+    samples = []
+    for model_cls in (VirtuousEmotivistModel, engine):
+        values = {name: [] for name in OUTPUTS}
+        for seed in seeds:
+            model = model_cls(seed, *model_args)
+            while model.running and model.schedule.steps < num_steps:
+                model.step()
+            for name in OUTPUTS:
+                values[name].append(getattr(model, name))
+            if hasattr(model, "close"):
+                model.close()
+        samples.append(values)
+    for name in OUTPUTS:
+        agent_based = np.array(samples[0][name])
+        vectorized = np.array(samples[1][name])
+        results[name] = (agent_based, vectorized, ks_statistic(agent_based, vectorized))
+    return results
@@ -0,0 +1,84 @@
+import random
+
+import numpy as np
+from mesa.space import SingleGrid
+
+from neighborhood import Neighborhood
+
+'''
+Grid layer for the "Virtuous-Emotivist segregating opinion transfer model".
+
+mesa's SingleGrid keeps its empty cells in a plain list, so placing an agent ("pos in empties",
+empties.remove(pos)) costs O(cells) and every move_to_empty call gets slower as the grid fills.
+IndexedSingleGrid keeps the same empties list but also a map from each empty cell to its index
+in the list, and removes cells by swapping them with the last entry, so position_agent,
+_remove_agent and move_to_empty are all O(1).
+It also keeps a neighborhood.Neighborhood up to date with the occupant of every cell.
+'''
+
+class IndexedSingleGrid(SingleGrid):
+    '''
+    SingleGrid with an O(1) index of empty cells. Random empty cells are drawn from "rng"
+    (anything with a random() method, e.g. the random module seeded by the model).
+    Agents need a type_code attribute and belief_code() and flags() methods for the neighborhood arrays.
+    '''
+    def __init__(self, width, height, torus, rng=random):
+        super().__init__(width, height, torus)
+        self.rng = rng
+        self.empty_index = {pos: i for i, pos in enumerate(self.empties)}
+        self.neighborhood = Neighborhood(width, height) # mesa's width is the x extent
+
+    def _add_empty(self, pos):
+        if pos not in self.empty_index:
+            self.empty_index[pos] = len(self.empties)
+            self.empties.append(pos)
+
+    def _discard_empty(self, pos):
+        # swap-remove: move the last empty cell into the slot of pos
+        i = self.empty_index.pop(pos, None)
+        if i is None:
+            return
+        last = self.empties.pop()
+        if (i < len(self.empties)):
+            self.empties[i] = last
+            self.empty_index[last] = i
+
+    def _place_agent(self, pos, agent):
+        x, y = pos
+        if (self.grid[x][y] is not None):
+            raise Exception("Cell not empty")
+        self.grid[x][y] = agent
+        self._discard_empty(pos)
+        self.neighborhood.place(self.neighborhood.cell(pos), agent, agent.type_code, agent.belief_code(), agent.flags())
+
+    def place_agents(self, cells, agents, type_codes, belief_codes, flags):
+        '''
+        Place agents in bulk, agents[i] at flat cell cells[i] (numbered as by neighborhood.cell),
+        on a grid that is empty. cells, type_codes, belief_codes and flags are NumPy arrays.
+        '''
+        neighborhood = self.neighborhood
+        xs, ys = np.divmod(cells, neighborhood.width)
+        for x, y, agent in zip(xs.tolist(), ys.tolist(), agents):
+            agent.pos = (x, y)
+            self.grid[x][y] = agent
+        neighborhood.place_many(cells, agents, type_codes, belief_codes, flags)
+        # the empty cells, in cell order
+        free = np.ones(neighborhood.height*neighborhood.width, dtype=bool)
+        free[cells] = False
+        xs, ys = np.divmod(np.flatnonzero(free), neighborhood.width)
+        self.empties = list(zip(xs.tolist(), ys.tolist()))
+        self.empty_index = {pos: i for i, pos in enumerate(self.empties)}
+
+    def _remove_agent(self, pos, agent):
+        x, y = pos
+        self.grid[x][y] = None
+        self._add_empty(pos)
+        self.neighborhood.remove(self.neighborhood.cell(pos))
+
+    def find_empty(self):
+        '''
+        Pick a random empty cell.
+        '''
+        if self.empties:
+            return self.empties[int(self.rng.random()*len(self.empties))]
+        return None
@@ -0,0 +1,56 @@
+from math import ceil
+import numpy as np
+
+'''
+Vectorized initial placement for the "Virtuous-Emotivist segregating opinion transfer model".
+
+sample_agents draws what VirtuousEmotivistModel.__init__ sets up one agent at a time (occupied
+cells, agent types, strongest beliefs and the extra-powerful / extra-determined emotivists) as
+NumPy arrays in a few O(cells) operations. It is used by the vectorized engine (engine.py) and
+by VirtuousEmotivistModel(..., init_backend="numpy"), which then creates the agents in bulk.
+'''
+
+def belief_choices(probs, length):
+    '''
+    The pregenerated list of "length" strongest belief codes of VirtuousEmotivistModel.__init__,
+    in order: code k for the fraction probs[k] of the list.
+    '''
+    frac = np.arange(length) / float(length) if length > 0 else np.zeros(0)
+    return np.minimum(np.searchsorted(np.cumsum(probs), frac, side="right"), len(probs)-1)
+
+def sample_agents(rng, cells, density, minority_pc, probs_virtuous, probs_emotivist, extras):
+    '''
+    Sample the initial agents of a grid of "cells" cells with NumPy Generator rng.
+    extras is a list of (belief code, count, power, determination) in order of precedence: the
+    first "count" emotivists with that strongest belief (in creation order) not taken by an
+    earlier entry get that power and determination.
+    Returns (occupied, num_virtuous, strongest, power, determination), arrays in creation order
+    (the virtuous agents first): the flat cell and strongest belief code of every agent, and
+    the power and determination of every agent.
+    '''
+    total_num_agents = density*cells
+    num_agents = min(cells, ceil(total_num_agents))
+    num_virtuous = min(num_agents, ceil(minority_pc*total_num_agents))
+
+    # same pregenerated lists of strongest beliefs as the agent-based model, then sampled without replacement
+    emo_list = belief_choices(probs_emotivist, ceil((1.0 - minority_pc)*total_num_agents))
+    vir_list = belief_choices(probs_virtuous, ceil(minority_pc*total_num_agents))
+    strongest = np.concatenate([rng.permutation(vir_list)[:num_virtuous]
+        , rng.permutation(emo_list)[:num_agents-num_virtuous]])
+    occupied = rng.permutation(cells)[:num_agents]
+
+    # extra-powerful / extra-determined emotivists, taken in creation order within each belief
+    power = np.ones(num_agents)
+    determination = np.zeros(num_agents)
+    emotivists = np.arange(num_virtuous, num_agents)
+    for b in range(len(probs_emotivist)):
+        members = emotivists[strongest[num_virtuous:] == b]
+        taken = 0
+        for belief, count, extra_power, extra_determination in extras:
+            if (belief != b):
+                continue
+            chosen = members[taken:taken+int(count)]
+            power[chosen] = extra_power
+            determination[chosen] = extra_determination
+            taken += chosen.size
+    return occupied, num_virtuous, strongest, power, determination
@@ -1,122 +1,235 @@
 import random
+from array import array
 from math import ceil
 import numpy as np
 
-from mesa import Model, Agent
+from mesa import Model
 from mesa.time import RandomActivation
-from mesa.space import SingleGrid
 from mesa.datacollection import DataCollector
 
-# random choice with probability
-def random_decision(probability):
-    return random.random() < probability
+from grid import IndexedSingleGrid
+from neighborhood import HAPPY, CONVINCED, EXTRA_POWER, EXTRA_DETERMINATION
+from initialization import belief_choices, sample_agents
+from rng import NumpyRandom
 
-'''
-Parameter changes from default, for situation where VirtuousAgents almost succeed
-fraction minority: 0.3
-neighbors to convert: 4
-prob of random move: 0.03
-VirtuousAgent homophily: 3
-'''
+# events counted per step as model attributes (e.g. model.random_moves): arguments made by emotivists
+# and those that succeeded, nudges of strenghten_tradition, conversions attempted and succeeded,
+# random moves and moves of unhappy agents. The counting is in "if __debug__:" blocks, so running
+# Python with -O compiles it out (the counters then stay 0).
+EVENTS = ["arguments", "arguments_succeeded", "nudges", "conversions_attempted", "conversions", "random_moves"
+    , "unhappy_moves"]
+
+# random choice with probability, drawn from rng (the model's random stream)
+def random_decision(rng, probability):
+    return rng.random() < probability
+
+NEIGHBORS = 8 # Moore neighborhood: at most 8 occupied neighbors, and one decision each per step
+
+# neighbor cells in the random order of neighbor_order (a permutation of range(NEIGHBORS))
+def ordered_neighbors(neighbors, neighbor_order):
+    count = len(neighbors)
+    return [neighbors[k] for k in neighbor_order if k < count]
+
+# code (index) of the strongest belief, the first one if some are equally strong
+def strongest_code(beliefs):
+    strongest = 0
+    for code in range(1, len(beliefs)):
+        if (beliefs[code] > beliefs[strongest]):
+            strongest = code
+    return strongest
+
+class BelievingAgent:
+    '''
+    Base of the model's agents. Agents are slotted (no per-agent __dict__), with every field of
+    both subclasses declared here so an emotivist can become virtuous in place. beliefs is an
+    array of floats indexed by belief code (the index into model.population), and strongest is
+    the code of the strongest belief, kept up to date by the nudges instead of recomputed on
+    every read. Like mesa's Agent, which has no slots, it has a unique_id, a model and a step().
+    '''
+    __slots__ = ("unique_id", "model", "pos", "beliefs", "strongest", "power", "determination", "happy", "convinced"
+        , "living", "active_from", "bias", "life_force")
 
-class BelievingAgent(Agent):
     def __init__(self, unique_id, pos, model, initial_beliefs):
         '''
          Create a new believing agent.
         '''
-        super().__init__(unique_id, model)
+        self.unique_id = unique_id
+        self.model = model
         self.pos = pos
-        self.beliefs = initial_beliefs
+        self.beliefs = array("d", initial_beliefs)
+        self.strongest = strongest_code(self.beliefs)
         self.power = 1.0
         self.determination = 0.0
         self.happy = False
         self.convinced = False
         self.living = True
+        self.active_from = 0 # first step the agent acts in
     
     # get the strongest belief
     # only returns the first belief if some are equally strong
     # change to return random belief
     def strongest_belief(self):
-        return max(self.beliefs, key=self.beliefs.get)
+        return self.model.population[self.strongest]
+    
+    def belief_code(self):
+        # index of the strongest belief in the population, as kept in the grid's neighborhood arrays
+        return self.strongest
+    
+    def nudge(self, suggested, amount):
+        '''
+        Strengthen belief code suggested by amount, weakening the others so they still sum to 1.0,
+        and update the strongest belief if it changed.
+        '''
+        beliefs = self.beliefs
+        others = amount / (len(beliefs)-1) # always normalize probs to 1.0
+        for code in range(len(beliefs)):
+            if (code == suggested):
+                beliefs[code] += amount
+            else:
+                beliefs[code] -= others
+        strongest = strongest_code(beliefs)
+        if (strongest != self.strongest):
+            self.strongest = strongest
+            neighborhood = self.model.grid.neighborhood
+            neighborhood.set_belief(neighborhood.cell(self.pos), strongest)
+    
+    def flags(self):
+        # display flag bits, as kept in the grid's neighborhood arrays
+        return (HAPPY if self.happy else 0) | (CONVINCED if self.convinced else 0) \
+            | (EXTRA_POWER if self.power > 1.0 else 0) | (EXTRA_DETERMINATION if self.determination > 0.0 else 0)
     
     def beliefs_string(self):
         out = ""
-        for belief, value in self.beliefs.items():
+        for belief, value in zip(self.model.population, self.beliefs):
             out += belief + ": " + "{0:.2f}".format(value) + " "
         return out
     
+    def set_happy_convinced(self, happy, convinced):
+        # report changes to the model-level counters and the neighborhood's display flags
+        if (happy == self.happy and convinced == self.convinced):
+            return
+        self.model.happy += happy - self.happy
+        self.model.convinced += convinced - self.convinced
+        self.happy = happy
+        self.convinced = convinced
+        neighborhood = self.model.grid.neighborhood
+        neighborhood.set_flags(neighborhood.cell(self.pos), self.flags())
+    
+    def move_to_empty(self):
+        self.model.grid.move_to_empty(self)
+        self.model.changes += 1
+    
     def die(self):
+        self.model.changes += 1
         self.model.grid._remove_agent(self.pos, self)
         self.model.schedule.remove(self)
         self.living = False
+        self.model.remove_from_counts(self)
+
+    def step(self, draws=None, neighbor_order=None):
+        '''
+        Act for one step. draws and neighbor_order are this agent's pre-drawn random numbers
+        of rng.NumpyRandom.step_draws, or None to draw from model.random as it goes.
+        '''
+        pass
         
     
 class EmotivistAgent(BelievingAgent):
     '''
     Emotivist agent.
     '''
+    __slots__ = ()
+    type_code = 0 # as the "type" agent reporter
+    
     def __init__(self, unique_id, pos, model, initial_beliefs, initial_bias, initial_power, initial_determination):
         '''
          Create a new emotivist agent.
+         initial_bias: argument success probability per belief code, one list shared by all emotivists.
         '''
         super().__init__(unique_id, pos, model, initial_beliefs)
         self.bias = initial_bias
         self.power = initial_power
         self.determination = initial_determination
         
-    def emotivist_argument(self, suggested_belief, suggestor_power):
-        strongest_belief = self.strongest_belief()
-        if (suggested_belief == strongest_belief):
-            if (self.beliefs[strongest_belief] >= 1.0):
+    def emotivist_argument(self, suggested, suggestor_power, draw=None):
+        # suggested is a belief code, draw a pre-drawn uniform or None
+        if (suggested == self.strongest):
+            if (self.beliefs[suggested] >= 1.0):
                 return # already convinced
         # check if emotivist argument succeeds, adjust beliefs
-        if (random_decision(self.bias[suggested_belief])):
-            for belief in self.beliefs:
-                if (belief == suggested_belief):
-                    self.beliefs[belief] += (self.model.nudge_amount*suggestor_power*(1-self.determination))
-                else:
-                    self.beliefs[belief] -= (self.model.nudge_amount*suggestor_power*(1-self.determination)) / (len(self.beliefs)-1) # always normalize probs to 1.0
+        if (random_decision(self.model.random, self.bias[suggested]) if draw is None else draw < self.bias[suggested]):
+            self.model.changes += 1
+            if __debug__:
+                self.model.arguments_succeeded += 1
+            self.nudge(suggested, self.model.nudge_amount*suggestor_power*(1-self.determination))
 
-    def step(self):
+    def become_virtuous(self, unique_id, initial_beliefs):
+        '''
+        Turn this emotivist into a new virtuous agent with id unique_id, in place: the object keeps
+        its slot in the schedule instead of dying and being replaced. As a replacement agent would be,
+        it is placed in a random empty cell and does not act until the next step.
+        '''
+        model = self.model
+        model.changes += 1
+        model.grid._remove_agent(self.pos, self)
+        model.remove_from_counts(self)
+        model.schedule.change_id(self, unique_id)
+        self.__class__ = VirtuousAgent
+        del self.bias
+        VirtuousAgent.__init__(self, unique_id, self.pos, model, initial_beliefs)
+        self.active_from = model.schedule.steps + 1
+        model.grid.position_agent(self)
+        model.virtuous_count += 1
+
+    def step(self, draws=None, neighbor_order=None):
         if (not self.living):
             return
     
         similar = 0
         randomly_moved = False
-        strongest_belief = self.strongest_belief()
+        strongest = self.strongest
         #random moving
-        if (random_decision(self.model.random_move_prob)):
-            self.model.grid.move_to_empty(self)
+        if (random_decision(self.model.random, self.model.random_move_prob) if draws is None
+                else draws[0] < self.model.random_move_prob):
+            self.move_to_empty()
             randomly_moved = True
+            if __debug__:
+                self.model.random_moves += 1
         
         argued_with_count = 0
-        # shuffle list of neighbors
-        neighbors = list(self.model.grid.neighbor_iter(self.pos))
-        random.shuffle(neighbors)
-        for neighbor in neighbors:
-            if isinstance(neighbor, type(self)):
+        # shuffle list of occupied neighbor cells
+        neighborhood = self.model.grid.neighborhood
+        neighbors = neighborhood.occupied_neighbors(neighborhood.cell(self.pos))
+        if (neighbor_order is None):
+            self.model.random.shuffle(neighbors)
+        else:
+            neighbors = ordered_neighbors(neighbors, neighbor_order)
+        for i, neighbor in enumerate(neighbors):
+            if (neighborhood.types[neighbor] == self.type_code):
                 similar += 1
                 if (argued_with_count < self.model.num_to_argue):
-                    neighbor.emotivist_argument(strongest_belief, self.power) # argue with neighbor
+                    # argue with neighbor
+                    neighborhood.agents[neighbor].emotivist_argument(strongest, self.power, None if draws is None else draws[1+i])
                     argued_with_count += 1
+        if __debug__:
+            self.model.arguments += argued_with_count
 
         # If unhappy, move:
-        if similar < self.model.homophily:
-            self.happy = False
-            if (not randomly_moved):
-                self.model.grid.move_to_empty(self)
-        else:
-            self.happy = True
+        happy = similar >= self.model.homophily
+        if (not happy and not randomly_moved):
+            self.move_to_empty()
+            if __debug__:
+                self.model.unhappy_moves += 1
             
-        if (self.beliefs[strongest_belief] >= self.model.convinced_threshold):
-            self.convinced = True
-        else:
-            self.convinced = False
+        self.set_happy_convinced(happy, self.beliefs[strongest] >= self.model.convinced_threshold)
 
 class VirtuousAgent(BelievingAgent):
     '''
     Virtuous agent
     '''
+    __slots__ = ()
+    type_code = 1
+    
     def __init__(self, unique_id, pos, model, initial_beliefs, life_force = 1.0):
         '''
          Create a new Virtuous agent.
@@ -124,85 +237,136 @@ class VirtuousAgent(BelievingAgent):
         super().__init__(unique_id, pos, model, initial_beliefs)
         self.life_force = life_force
     
-    def strenghten_tradition(self, neighbor, suggested_belief):
-        strongest_belief = self.strongest_belief()
-        if (suggested_belief == strongest_belief):
-            if (self.beliefs[strongest_belief] >= 1.0):
+    def strenghten_tradition(self, neighbor, suggested):
+        # suggested is a belief code
+        if (suggested == self.strongest):
+            if (self.beliefs[suggested] >= 1.0):
                 return # already convinced
         # strenghten beliefs of neighbor, neighbor will strenghten in return
-        for belief in neighbor.beliefs:
-            if (belief == suggested_belief):
-                neighbor.beliefs[belief] += self.model.nudge_amount
-            else:
-                neighbor.beliefs[belief] -= self.model.nudge_amount / (len(self.beliefs)-1) # always normalize probs to 1.0
+        self.model.changes += 1
+        if __debug__:
+            self.model.nudges += 1
+        neighbor.nudge(suggested, self.model.nudge_amount)
                 
-    def convert_emotivist(self, neighbor, suggested_belief):
-        neighbor_pos = neighbor.pos
+    def convert_emotivist(self, neighbor, suggested):
         # destroy emotivist and replace with a new virtuous agent in the same tradition
-        initial_strongestbelief_virtuous = suggested_belief
-        initial_beliefs_virtuous = {}
-        for belief in self.model.population:
-            if (belief == initial_strongestbelief_virtuous):
-                initial_beliefs_virtuous[belief] = self.model.strongest_belief_weight
-            else:
-                initial_beliefs_virtuous[belief] = (1-self.model.strongest_belief_weight)/(len(self.model.population)-1)
-        agent = VirtuousAgent(self.model.last_agent_id, neighbor_pos, self.model, initial_beliefs_virtuous)
+        neighbor.become_virtuous(self.model.last_agent_id, self.model.initial_beliefs[suggested])
         self.model.last_agent_id += 1
-        neighbor.die()
-        self.model.grid.position_agent(agent, neighbor_pos)
-        self.model.schedule.add(agent)
-        #print("Converted: " + str(neighbor_pos))
     
 
-    def step(self):
+    def step(self, draws=None, neighbor_order=None):
         if (not self.living):
             return
         
         similar = 0
         randomly_moved = False
-        strongest_belief = self.strongest_belief()
+        strongest = self.strongest
         #random moving
-        if (random_decision(self.model.random_move_prob)):
-            self.model.grid.move_to_empty(self)
+        if (random_decision(self.model.random, self.model.random_move_prob) if draws is None
+                else draws[0] < self.model.random_move_prob):
+            self.move_to_empty()
             randomly_moved = True
+            if __debug__:
+                self.model.random_moves += 1
             
         tried_to_convert = 0
+        attempts = 0
         
-        # shuffle list of neighbors
-        neighbors = list(self.model.grid.neighbor_iter(self.pos))
-        random.shuffle(neighbors)
+        # shuffle list of occupied neighbor cells
+        neighborhood = self.model.grid.neighborhood
+        neighbors = neighborhood.occupied_neighbors(neighborhood.cell(self.pos))
+        if (neighbor_order is None):
+            self.model.random.shuffle(neighbors)
+        else:
+            neighbors = ordered_neighbors(neighbors, neighbor_order)
         # strenghten tradition and try to convert neighboring emotivists
-        for neighbor in neighbors:
-            if (isinstance(neighbor, type(self)) and neighbor.strongest_belief() == strongest_belief):
+        for i, neighbor in enumerate(neighbors):
+            neighbor_type = neighborhood.types[neighbor]
+            if (neighbor_type == self.type_code and neighborhood.belief_codes[neighbor] == strongest):
                 similar += 1
-                self.strenghten_tradition(neighbor, strongest_belief)
-            elif (isinstance(neighbor, EmotivistAgent) and tried_to_convert < self.model.num_to_convert):
-                if (random_decision(self.model.convert_prob)):
-                    self.convert_emotivist(neighbor, strongest_belief)
+                self.strenghten_tradition(neighborhood.agents[neighbor], strongest)
+            elif (neighbor_type == EmotivistAgent.type_code and tried_to_convert < self.model.num_to_convert):
+                if __debug__:
+                    attempts += 1
+                if (random_decision(self.model.random, self.model.convert_prob) if draws is None
+                        else draws[1+i] < self.model.convert_prob):
+                    self.convert_emotivist(neighborhood.agents[neighbor], strongest)
                     tried_to_convert += 1
+        if __debug__:
+            self.model.conversions_attempted += attempts
+            self.model.conversions += tried_to_convert
 
         # If unhappy, move:
-        if similar < self.model.virtuous_homophily:
-            self.happy = False
+        happy = similar >= self.model.virtuous_homophily
+        if not happy:
             #lose life force
             self.life_force -= self.model.traditionless_life_decrease / (similar+1)
             if (not randomly_moved):
-                self.model.grid.move_to_empty(self)
+                self.move_to_empty()
+                if __debug__:
+                    self.model.unhappy_moves += 1
         else:
-            self.happy = True
             if (self.life_force < 1.0): #heal until over 1
                 self.life_force += self.model.traditionless_life_decrease * similar
         
-        if (self.beliefs[strongest_belief] >= self.model.convinced_threshold):
-            self.convinced = True
-        else:
-            self.convinced = False
+        self.set_happy_convinced(happy, self.beliefs[strongest] >= self.model.convinced_threshold)
         
         # if life is too low, die
         if (self.life_force < 0.0):
             self.die()
             self.model.virtuous_death_count += 1
 
+class ModelRandomActivation(RandomActivation):
+    '''
+    RandomActivation that shuffles the agents with the model's random stream, keeping them in a
+    compact list with an id -> slot map, so adding, removing (swap with the last slot) and
+    changing the id of a converted agent are O(1).
+    '''
+    def __init__(self, model):
+        super().__init__(model)
+        self.slots = []
+        self.slot_of = {}
+
+    def add(self, agent):
+        self.slot_of[agent.unique_id] = len(self.slots)
+        self.slots.append(agent)
+
+    def remove(self, agent):
+        slot = self.slot_of.pop(agent.unique_id)
+        last = self.slots.pop()
+        if (slot < len(self.slots)):
+            self.slots[slot] = last
+            self.slot_of[last.unique_id] = slot
+
+    def change_id(self, agent, unique_id):
+        self.slot_of[unique_id] = self.slot_of.pop(agent.unique_id)
+
+    def get_agent_count(self):
+        return len(self.slots)
+
+    @property
+    def agents(self):
+        return list(self.slots)
+
+    def step(self):
+        agents = self.agents
+        rng = self.model.random
+        if (isinstance(rng, NumpyRandom)):
+            # the whole step's random numbers at once, read by index
+            order, uniforms, neighbor_orders = rng.step_draws(len(agents), NEIGHBORS)
+            for i, draws, neighbor_order in zip(order, uniforms, neighbor_orders):
+                agent = agents[i]
+                # agents that died earlier in the step return right away, converted ones wait a step
+                if (agent.active_from <= self.steps):
+                    agent.step(draws, neighbor_order)
+        else:
+            rng.shuffle(agents)
+            for agent in agents:
+                if (agent.active_from <= self.steps):
+                    agent.step()
+        self.steps += 1
+        self.time += 1
+
 class VirtuousEmotivistModel(Model):
     '''
     Model class for the "Virtuous-Emotivist segregating opinion transfer model".
@@ -211,11 +375,38 @@ class VirtuousEmotivistModel(Model):
     def __init__(self, init_seed, height, width, density, minority_pc, homophily, virtuous_homophily, nudge_amount, num_to_argue, num_to_convert, convert_prob, convinced_threshold \
             , random_move_prob, traditionless_life_decrease, vir_a, vir_b, vir_c, emo_a, emo_b \
             , emo_c , emo_bias_a, emo_bias_b, emo_bias_c , strongest_belief_weight, count_extra_pow, count_extra_det \
-            , count_extra_det_pow, extra_pow, extra_det , belief_of_extra_pow, belief_of_extra_det, belief_of_extra_det_pow):
+            , count_extra_det_pow, extra_pow, extra_det , belief_of_extra_pow, belief_of_extra_det, belief_of_extra_det_pow \
+            , collect_agent_vars=True, collector=None, rng_backend="python", steady_state=None, init_backend="python"):
+        '''
+        collect_agent_vars=False turns off agent-level data collection (x, y, happy, ...) for faster
+        batch runs; the model-level counts are kept incrementally and do not depend on it.
+        collector is an optional collector.ColumnarCollector that is fed after setup and every step.
+        All random draws come from self.random, seeded with init_seed: a random.Random, or with
+        rng_backend="numpy" a rng.NumpyRandom that draws each step's random numbers up front.
+        steady_state is an optional convergence.SteadyStateDetector that stops the run early.
+        init_backend="numpy" draws the initial agents with vectorized NumPy sampling and places them
+        in bulk (populate_vectorized), which is much faster on large grids; the initial grid has the
+        same distribution as with the default agent-by-agent setup, but not the same draws.
+        '''
 
         
         # uncomment to make runs reproducible
         super().__init__(seed=init_seed)
+        # kept for checkpoints (checkpoint.py)
+        self.model_args = (init_seed, height, width, density, minority_pc, homophily, virtuous_homophily, nudge_amount \
+            , num_to_argue, num_to_convert, convert_prob, convinced_threshold, random_move_prob, traditionless_life_decrease \
+            , vir_a, vir_b, vir_c, emo_a, emo_b, emo_c, emo_bias_a, emo_bias_b, emo_bias_c, strongest_belief_weight \
+            , count_extra_pow, count_extra_det, count_extra_det_pow, extra_pow, extra_det, belief_of_extra_pow \
+            , belief_of_extra_det, belief_of_extra_det_pow)
+        self.rng_backend = rng_backend
+        if (rng_backend == "numpy"):
+            self.random = NumpyRandom(init_seed, block_size=height*width) # random() only picks empty cells to move to
+        elif (rng_backend == "python"):
+            self.random = random.Random(init_seed)
+        else:
+            raise ValueError("Unknown rng_backend: " + str(rng_backend))
+        if (init_backend not in ("python", "numpy")):
+            raise ValueError("Unknown init_backend: " + str(init_backend))
         
         self.height = height
         self.width = width
@@ -227,22 +418,25 @@ class VirtuousEmotivistModel(Model):
         self.convert_prob = convert_prob
         self.num_to_convert = num_to_convert
         self.traditionless_life_decrease = traditionless_life_decrease
-        self.steps_since = 0
         
-        self.schedule = RandomActivation(self)
-        self.grid = SingleGrid(height, width, torus=True)
+        self.schedule = ModelRandomActivation(self)
+        self.grid = IndexedSingleGrid(height, width, torus=True, rng=self.random) # O(1) empty cell lookups
         
         self.happy = 0
         self.convinced = 0
         self.virtuous_count = 0
         self.emotivist_count = 0
         self.virtuous_death_count = 0
-        self.datacollector = DataCollector( # Model-level variables for graphs
-            {"happy": "happy", "convinced": "convinced", "emotivist_count": "emotivist_count" \
-                , "virtuous_count": "virtuous_count", "virtuous_death_count": "virtuous_death_count"},  
-            {"x": lambda a: a.pos[0], "y": lambda a: a.pos[1], "happy": lambda a: a.happy, # Agent-level variables
+        agent_reporters = None
+        if collect_agent_vars:
+            agent_reporters = {"x": lambda a: a.pos[0], "y": lambda a: a.pos[1], "happy": lambda a: a.happy, # Agent-level variables
             "convinced": lambda a: a.convinced, "strongest_belief": lambda a: a.strongest_belief()
-            , "beliefs": lambda a: a.beliefs_string(), "type": lambda a: 0 if isinstance(a, EmotivistAgent) else 1})
+            , "beliefs": lambda a: a.beliefs_string(), "type": lambda a: 0 if isinstance(a, EmotivistAgent) else 1}
+        self.datacollector = DataCollector( # Model-level variables for graphs
+            dict({"happy": "happy", "convinced": "convinced", "emotivist_count": "emotivist_count" \
+                , "virtuous_count": "virtuous_count", "virtuous_death_count": "virtuous_death_count"}
+                , **{name: name for name in EVENTS}),
+            agent_reporters)
         
         self.nudge_amount = nudge_amount
         self.num_to_argue = num_to_argue
@@ -255,144 +449,171 @@ class VirtuousEmotivistModel(Model):
         probs_emotivist = probs_emotivist / np.sum(probs_emotivist) # normalize probs to 1.0
         probs_virtuous = np.array([vir_a, vir_b, vir_c])
         probs_virtuous = probs_virtuous / np.sum(probs_virtuous)
-        initial_bias_emotivist = {"A": emo_bias_a, "B": emo_bias_b, "C": emo_bias_c}
-        self.strongest_belief_weight = strongest_belief_weight
+        initial_bias_emotivist = [emo_bias_a, emo_bias_b, emo_bias_c]
+        self.set_strongest_belief_weight(strongest_belief_weight)
         
         # Set up agents
-        # We get a list of cells in order from the grid iterator
-        # and randomize the list
-        cell_list = list(self.grid.coord_iter())
-        random.shuffle(cell_list)
-        total_num_agents = self.density*self.width*self.height
-        
-        det_emotivists_added = 0
-        pow_emotivists_added = 0
-        det_pow_emotivists_added = 0
-        
-        # pregenerate a list of strongest_beliefs in random order according to distribution
-        # currently only works with a population of 3 beliefs
-        list_emotivist_choices = []
-        emo_length = ceil((1.0 - self.minority_pc)*total_num_agents)
-        for i in range(0,emo_length):
-            if (float(i)/emo_length < probs_emotivist[0]):
-                list_emotivist_choices.append(population[0])
-            elif (float(i)/emo_length < probs_emotivist[0]+probs_emotivist[1]):
-                list_emotivist_choices.append(population[1])
-            else:
-                list_emotivist_choices.append(population[2])
+        if (init_backend == "numpy"):
+            # extra determined+powerful emotivists only get extra power, as in the loop below
+            extras = [(population.index(belief), count, pow, det) for belief, count, pow, det in [
+                (belief_of_extra_det, count_extra_det, 1.0, extra_det), (belief_of_extra_pow, count_extra_pow, extra_pow, 0.0)
+                , (belief_of_extra_det_pow, count_extra_det_pow, extra_pow, 0.0)] if belief in population]
+            self.populate_vectorized(probs_virtuous, probs_emotivist, initial_bias_emotivist, extras)
+        else:
+            # We get a list of cells in order from the grid iterator
+            # and randomize the list
+            cell_list = list(self.grid.coord_iter())
+            self.random.shuffle(cell_list)
+            total_num_agents = self.density*self.width*self.height
         
-        random.shuffle(list_emotivist_choices)
+            det_emotivists_added = 0
+            pow_emotivists_added = 0
+            det_pow_emotivists_added = 0
         
-        list_virtuous_choices = []
-        vir_length = ceil(self.minority_pc*total_num_agents)
-        for i in range(0,vir_length):
-            if (float(i)/vir_length < probs_virtuous[0]):
-                list_virtuous_choices.append(population[0])
-            elif (float(i)/vir_length < probs_virtuous[0]+probs_virtuous[1]):
-                list_virtuous_choices.append(population[1])
-            else:
-                list_virtuous_choices.append(population[2])
+            # pregenerate a list of strongest belief codes in random order according to distribution
+            list_emotivist_choices = belief_choices(probs_emotivist, ceil((1.0 - self.minority_pc)*total_num_agents)).tolist()
+            self.random.shuffle(list_emotivist_choices)
+            list_virtuous_choices = belief_choices(probs_virtuous, ceil(self.minority_pc*total_num_agents)).tolist()
+            self.random.shuffle(list_virtuous_choices)
+            code_of_extra_pow = population.index(belief_of_extra_pow) if belief_of_extra_pow in population else None
+            code_of_extra_det = population.index(belief_of_extra_det) if belief_of_extra_det in population else None
+            code_of_extra_det_pow = population.index(belief_of_extra_det_pow) if belief_of_extra_det_pow in population else None
         
-        random.shuffle(list_virtuous_choices)
-        
-        # create agents and add to grid
-        i=0
-        for cell in cell_list:
-            x = cell[1]
-            y = cell[2]
-            if i < total_num_agents:
-                if i < self.minority_pc*total_num_agents:
-                    #initial_strongestbelief_virtuous = random.choices(population, weights=probs_virtuous, k=1)[0]
-                    initial_strongestbelief_virtuous = list_virtuous_choices.pop()
-                    initial_beliefs_virtuous = {}
-                    for belief in population:
-                        if (belief == initial_strongestbelief_virtuous):
-                            initial_beliefs_virtuous[belief] = strongest_belief_weight
-                        else:
-                            initial_beliefs_virtuous[belief] = (1-strongest_belief_weight)/(len(population)-1)
-                    agent = VirtuousAgent(i, (x, y), self, initial_beliefs_virtuous)
-                    self.virtuous_count += 1
-                else:
-                    #agent_type = 0
-                    #initial_strongestbelief_emotivist = random.choices(population, weights=probs_emotivist, k=1)[0]
-                    initial_strongestbelief_emotivist = list_emotivist_choices.pop()
-                    initial_beliefs_emotivist = {}
-                    det = 0.0
-                    pow = 1.0
-                    if (initial_strongestbelief_emotivist == belief_of_extra_det and det_emotivists_added < count_extra_det):
-                        det = extra_det
-                        det_emotivists_added += 1
-                    elif (initial_strongestbelief_emotivist == belief_of_extra_pow and pow_emotivists_added < count_extra_pow):
-                        pow = extra_pow
-                        pow_emotivists_added += 1
-                    elif (initial_strongestbelief_emotivist == belief_of_extra_det_pow and det_pow_emotivists_added < count_extra_det_pow):
-                        pow = extra_pow
-                        det_pow_emotivists_added += 1
-                    
+            # create agents and add to grid
+            i=0
+            for cell in cell_list:
+                x = cell[1]
+                y = cell[2]
+                if i < total_num_agents:
+                    if i < self.minority_pc*total_num_agents:
+                        #initial_strongestbelief_virtuous = random.choices(population, weights=probs_virtuous, k=1)[0]
+                        initial_strongestbelief_virtuous = list_virtuous_choices.pop()
+                        agent = VirtuousAgent(i, (x, y), self, self.initial_beliefs[initial_strongestbelief_virtuous])
+                        self.virtuous_count += 1
+                    else:
+                        #agent_type = 0
+                        #initial_strongestbelief_emotivist = random.choices(population, weights=probs_emotivist, k=1)[0]
+                        initial_strongestbelief_emotivist = list_emotivist_choices.pop()
+                        det = 0.0
+                        pow = 1.0
+                        if (initial_strongestbelief_emotivist == code_of_extra_det and det_emotivists_added < count_extra_det):
+                            det = extra_det
+                            det_emotivists_added += 1
+                        elif (initial_strongestbelief_emotivist == code_of_extra_pow and pow_emotivists_added < count_extra_pow):
+                            pow = extra_pow
+                            pow_emotivists_added += 1
+                        elif (initial_strongestbelief_emotivist == code_of_extra_det_pow and det_pow_emotivists_added < count_extra_det_pow):
+                            pow = extra_pow
+                            det_pow_emotivists_added += 1
                     
-                    for belief in population:
-                        if (belief == initial_strongestbelief_emotivist):
-                            initial_beliefs_emotivist[belief] = strongest_belief_weight
-                        else:
-                            initial_beliefs_emotivist[belief] = (1-strongest_belief_weight)/(len(population)-1)
-                    
-                    agent = EmotivistAgent(i, (x, y), self, initial_beliefs_emotivist, initial_bias_emotivist, pow, det)
-                    self.emotivist_count += 1
+                        agent = EmotivistAgent(i, (x, y), self, self.initial_beliefs[initial_strongestbelief_emotivist], initial_bias_emotivist, pow, det)
+                        self.emotivist_count += 1
                 
-                i += 1
-                self.grid.position_agent(agent, (x, y))
-                self.schedule.add(agent)
+                    i += 1
+                    self.grid.position_agent(agent, (x, y))
+                    self.schedule.add(agent)
                 
-        self.last_agent_id = i
+            self.last_agent_id = i
         # update message with starting probs
         self.message = "Emotivist probs: " + str(list(map(lambda x: "{:.2f}".format(x), probs_emotivist.tolist()))) \
                 + ", Virtuous probs: " + str(list(map(lambda x: "{:.2f}".format(x), probs_virtuous.tolist())))
         self.running = True
+        self.collector = collector
+        self.steady_state = steady_state
+        self.changes = 0 # moves, belief nudges, conversions and deaths in the current step
+        self.reset_events()
+        self.collect()
+
+    def populate_vectorized(self, probs_virtuous, probs_emotivist, initial_bias_emotivist, extras):
+        '''
+        Create the initial agents in bulk: occupied cells, types, strongest beliefs and the extra
+        emotivists (extras as for initialization.sample_agents) are sampled as arrays, and the
+        agents are placed with one IndexedSingleGrid.place_agents call. Agent ids are in creation
+        order, virtuous agents first, as in the agent-by-agent setup.
+        '''
+        if (self.rng_backend == "numpy"):
+            generator = self.random.generator
+        else:
+            generator = np.random.default_rng(self.random.getrandbits(64))
+        occupied, num_virtuous, strongest, power, determination = sample_agents(generator, self.height*self.width
+            , self.density, self.minority_pc, probs_virtuous, probs_emotivist, extras)
+        initial_beliefs = self.initial_beliefs
+        agents = [VirtuousAgent(i, None, self, initial_beliefs[code]) for i, code in enumerate(strongest[:num_virtuous].tolist())]
+        for i, code, pow, det in zip(range(num_virtuous, occupied.size), strongest[num_virtuous:].tolist()
+                , power[num_virtuous:].tolist(), determination[num_virtuous:].tolist()):
+            agents.append(EmotivistAgent(i, None, self, initial_beliefs[code], initial_bias_emotivist, pow, det))
+        type_codes = np.where(np.arange(occupied.size) < num_virtuous, VirtuousAgent.type_code, EmotivistAgent.type_code)
+        flags = np.where(power > 1.0, EXTRA_POWER, 0) | np.where(determination > 0.0, EXTRA_DETERMINATION, 0)
+        # the sampled code is not the strongest belief if strongest_belief_weight < 1/len(population)
+        belief_codes = np.array([agent.strongest for agent in agents], dtype=np.intp)
+        self.grid.place_agents(occupied, agents, type_codes, belief_codes, flags)
+        for agent in agents:
+            self.schedule.add(agent)
+        self.virtuous_count = num_virtuous
+        self.emotivist_count = occupied.size - num_virtuous
+        self.last_agent_id = occupied.size
+
+    def set_strongest_belief_weight(self, strongest_belief_weight):
+        '''
+        Set strongest_belief_weight and the initial beliefs of new agents (initial_beliefs, per
+        strongest belief code) that follow from it.
+        '''
+        self.strongest_belief_weight = strongest_belief_weight
+        n = len(self.population)
+        self.initial_beliefs = [[strongest_belief_weight if belief == strongest else (1-strongest_belief_weight)/(n-1)
+            for belief in range(n)] for strongest in range(n)]
+
+    def collect(self):
         self.datacollector.collect(self)
+        if self.collector is not None:
+            self.collector.collect(self)
 
-    def update_emo_vir_count(self):
-        emotivist_count = 0
-        virtuous_count = 0
-        for agent_type in self.datacollector.agent_vars["type"][-1]:
-            if (agent_type[1] == 0):
-                emotivist_count += 1
-            else:
-                virtuous_count += 1
-        
-        self.emotivist_count = emotivist_count
-        self.virtuous_count = virtuous_count
-        
-    def update_happy_convinced_count(self):
-        tmphappy = 0
-        for agent_happy in self.datacollector.agent_vars["happy"][-1]:
-            if (agent_happy[1]):
-                tmphappy += 1
-        tmpconvinced = 0
-        for agent_convinced in self.datacollector.agent_vars["convinced"][-1]:
-            if (agent_convinced[1]):
-                tmpconvinced += 1
-
-        self.happy = tmphappy
-        self.convinced = tmpconvinced
+    def remove_from_counts(self, agent):
+        '''
+        Remove a dead agent from the model-level counts, which are otherwise kept up to date
+        by the agents as their state changes.
+        '''
+        self.happy -= agent.happy
+        self.convinced -= agent.convinced
+        if isinstance(agent, EmotivistAgent):
+            self.emotivist_count -= 1
+        else:
+            self.virtuous_count -= 1
+
+    def reset_events(self):
+        for name in EVENTS:
+            setattr(self, name, 0)
+
+    def events(self):
+        '''
+        Dict of the event counts (EVENTS) of the current step.
+        '''
+        return {name: getattr(self, name) for name in EVENTS}
 
-        
     def step(self):
         '''
-        Run one step of the model. Uncomment "self.running = False" to enable auto-stopping after the
-        model has run for 200 steps with almost all agents happy and convinced
+        Run one step of the model. If a steady_state detector was given, the model stops
+        (running = False) once it reports a steady state.
         '''
-        # Reset counter of happy agents
+        self.changes = 0
+        self.reset_events()
         self.schedule.step()
-        # collect data
-        self.datacollector.collect(self)
-        
-        # update model-level counts
-        self.update_happy_convinced_count()
-        self.update_emo_vir_count()
+        # collect data, model-level counts are already up to date
+        self.collect()
         
-        # optional auto-stopping
-        if self.happy > self.schedule.get_agent_count()-3 and self.convinced == self.schedule.get_agent_count()-3:
-            self.steps_since += 1
-            if (self.steps_since > 200):
-                #self.running = False
-                pass
+        if self.steady_state is not None and self.steady_state.update(self):
+            self.running = False
+
+    def run_to(self, num_steps):
+        '''
+        Run until step num_steps. If the model stops early, its final state is carried forward
+        (collected again for every remaining step without running the agents), so outputs like
+        virtuous_count at step num_steps stay defined.
+        '''
+        while self.running and self.schedule.steps < num_steps:
+            self.step()
+        while self.schedule.steps < num_steps:
+            self.schedule.steps += 1
+            self.schedule.time += 1
+            self.reset_events()
+            self.collect()
@@ -0,0 +1,134 @@
+import numpy as np
+
+'''
+Neighborhood service for the "Virtuous-Emotivist segregating opinion transfer model".
+
+Cells are numbered flat, cell = x*width + y with x in range(height), as in engine.py.
+The Moore neighbor table of a torus is computed once per grid shape and shared by every model
+(and engine replica) of that shape in the process. Neighborhood keeps the occupant type and the
+strongest belief code of every cell in byte arrays, so neighbor queries are table and array
+lookups instead of torus coordinate math, isinstance checks and strongest_belief() calls.
+It also keeps display flags per cell and the number of agents per type and strongest belief,
+for the visualization (visualization.py, server.py).
+'''
+
+EMPTY = 255 # type and belief code of an empty cell in the byte arrays
+TYPES = 2 # agent type codes: 0 emotivist, 1 virtuous
+# display flag bits of an agent, see BelievingAgent.flags
+HAPPY = 1
+CONVINCED = 2
+EXTRA_POWER = 4
+EXTRA_DETERMINATION = 8
+MOORE_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+_tables = {}
+_lists = {}
+
+def torus_neighbor_table(height, width):
+    '''
+    Flat (height*width, 8) table of Moore neighbor cell indices on a torus, cached per shape.
+    The table is shared, so it is read-only.
+    '''
+    if (height, width) not in _tables:
+        x, y = np.divmod(np.arange(height*width), width)
+        table = np.empty((height*width, 8), dtype=np.intp)
+        for j, (dx, dy) in enumerate(MOORE_OFFSETS):
+            table[:, j] = ((x + dx) % height)*width + (y + dy) % width
+        table.flags.writeable = False
+        _tables[(height, width)] = table
+    return _tables[(height, width)]
+
+def torus_neighbor_lists(height, width):
+    '''
+    The neighbor table as a tuple of tuples of Python ints (faster to loop over from Python),
+    without the repeated cells that grids narrower than 3 have. Cached per shape.
+    '''
+    if (height, width) not in _lists:
+        table = torus_neighbor_table(height, width)
+        if (height >= 3 and width >= 3):
+            # no repeated cells: cut one flat list into rows, much faster than tolist() on large grids
+            flat = table.ravel().tolist()
+            _lists[(height, width)] = tuple(zip(*[iter(flat)]*8))
+        else:
+            _lists[(height, width)] = tuple(tuple(dict.fromkeys(row)) for row in table.tolist())
+    return _lists[(height, width)]
+
+class Neighborhood:
+    '''
+    Occupant type, strongest belief code and display flags per cell of a height x width torus,
+    plus the agents themselves, kept up to date by the grid (place/remove) and the agents
+    (set_belief, set_flags). belief_counts[type][belief] is the number of agents of that type
+    whose strongest belief code is belief.
+    '''
+    def __init__(self, height, width, n_beliefs=3):
+        self.height = height
+        self.width = width
+        self.neighbors = torus_neighbor_lists(height, width)
+        self.agents = [None]*(height*width)
+        self.types = bytearray([EMPTY])*(height*width)
+        self.belief_codes = bytearray([EMPTY])*(height*width)
+        self.flags = bytearray(height*width)
+        self.belief_counts = [[0]*n_beliefs for type_code in range(TYPES)]
+
+    def cell(self, pos):
+        return pos[0]*self.width + pos[1]
+
+    def place(self, cell, agent, type_code, belief_code, flags=0):
+        self.agents[cell] = agent
+        self.types[cell] = type_code
+        self.belief_codes[cell] = belief_code
+        self.flags[cell] = flags
+        self.belief_counts[type_code][belief_code] += 1
+
+    def remove(self, cell):
+        self.belief_counts[self.types[cell]][self.belief_codes[cell]] -= 1
+        self.agents[cell] = None
+        self.types[cell] = EMPTY
+        self.belief_codes[cell] = EMPTY
+        self.flags[cell] = 0
+
+    def place_many(self, cells, agents, type_codes, belief_codes, flags):
+        '''
+        place() in bulk: agents[i] at cells[i], with codes and flags from NumPy arrays.
+        '''
+        for cell, agent in zip(cells.tolist(), agents):
+            self.agents[cell] = agent
+        np.frombuffer(self.types, dtype=np.uint8)[cells] = type_codes
+        np.frombuffer(self.belief_codes, dtype=np.uint8)[cells] = belief_codes
+        np.frombuffer(self.flags, dtype=np.uint8)[cells] = flags
+        for type_code, counts in enumerate(self.belief_counts):
+            added = np.bincount(belief_codes[type_codes == type_code], minlength=len(counts))
+            for belief_code, count in enumerate(added.tolist()):
+                counts[belief_code] += count
+
+    def set_belief(self, cell, belief_code):
+        counts = self.belief_counts[self.types[cell]]
+        counts[self.belief_codes[cell]] -= 1
+        counts[belief_code] += 1
+        self.belief_codes[cell] = belief_code
+
+    def set_flags(self, cell, flags):
+        self.flags[cell] = flags
+
+    def occupied_neighbors(self, cell):
+        '''
+        List of the occupied neighbor cells of cell.
+        '''
+        types = self.types
+        return [neighbor for neighbor in self.neighbors[cell] if types[neighbor] != EMPTY]
+
+    def count_neighbors(self, cell, type_code, belief_code=None):
+        '''
+        Number of neighbors of cell with the given type (and strongest belief code, if given).
+        '''
+        types = self.types
+        codes = self.belief_codes
+        return sum(1 for neighbor in self.neighbors[cell] if types[neighbor] == type_code
+            and (belief_code is None or codes[neighbor] == belief_code))
+
+    def type_array(self):
+        # zero-copy NumPy views of the byte arrays, for whole-grid queries
+        return np.frombuffer(self.types, dtype=np.uint8).reshape(self.height, self.width)
+
+    def belief_array(self):
+        return np.frombuffer(self.belief_codes, dtype=np.uint8).reshape(self.height, self.width)
@@ -0,0 +1,181 @@
+import argparse
+import json
+import os
+from types import SimpleNamespace
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from model import EVENTS, VirtuousEmotivistModel
+
+'''
+Memory-mapped run recordings of the "Virtuous-Emotivist segregating opinion transfer model".
+
+RunRecorder writes the state of every cell at every step into files that are preallocated for
+the whole run and memory-mapped, so a long run on a large grid needs no more memory than one
+step. A recording is a directory of:
+
+    cells.npy    uint8 (steps+1, cells, 3): type code (255 empty), strongest belief code, flags
+                 (bits as in neighborhood.py: happy, convinced, extra power, extra determination)
+    beliefs.npy  uint8 (steps+1, cells, beliefs), optional: beliefs quantized to 1/255, clipped to [0, 1]
+    index.npy    one row of model-level counters and event counts per step; "steps" is -1 for
+                 steps not recorded
+    run.json     grid shape, population, model arguments and the files present
+
+Cells are numbered flat as in neighborhood.py, cell = x*width + y. Recording(path) reads a
+recording back without loading it, and server.py --replay PATH scrubs through one:
+
+    recorder = RunRecorder("run1", 500, beliefs=True)
+    model = VirtuousEmotivistModel(*args, collect_agent_vars=False, collector=recorder)
+    model.run_to(500)
+    recorder.close()
+    Recording("run1").frame(250)
+'''
+
+COUNTERS = ["happy", "convinced", "virtuous_count", "emotivist_count", "virtuous_death_count", "changes"] + EVENTS
+INDEX_DTYPE = np.dtype([("steps", np.int64)] + [(name, np.int64) for name in COUNTERS])
+LEVELS = 255 # quantization levels of recorded beliefs
+
+class RunRecorder:
+    '''
+    Record a model run of up to num_steps steps into directory path, with quantized beliefs
+    if beliefs=True. Pass it to VirtuousEmotivistModel(..., collector=recorder), the model calls
+    collect() after setup and after every step. The files are allocated on the first collect.
+    '''
+    def __init__(self, path, num_steps, beliefs=False):
+        self.path = path
+        self.num_steps = num_steps
+        self.record_beliefs = beliefs
+        self.cells = None
+        self.beliefs = None
+        self.index = None
+
+    def allocate(self, model):
+        os.makedirs(self.path, exist_ok=True)
+        neighborhood = model.grid.neighborhood
+        cells = neighborhood.height*neighborhood.width
+        self.cells = open_memmap(os.path.join(self.path, "cells.npy"), mode="w+", dtype=np.uint8
+            , shape=(self.num_steps+1, cells, 3))
+        if self.record_beliefs:
+            self.beliefs = open_memmap(os.path.join(self.path, "beliefs.npy"), mode="w+", dtype=np.uint8
+                , shape=(self.num_steps+1, cells, len(model.population)))
+        self.index = open_memmap(os.path.join(self.path, "index.npy"), mode="w+", dtype=INDEX_DTYPE
+            , shape=(self.num_steps+1,))
+        self.index["steps"] = -1
+        run = {"height": neighborhood.height, "width": neighborhood.width, "population": model.population
+            , "model_args": list(model.model_args), "num_steps": self.num_steps, "beliefs": self.record_beliefs}
+        with open(os.path.join(self.path, "run.json"), "w") as f:
+            json.dump(run, f, indent=1)
+
+    def collect(self, model):
+        '''
+        Record the current step of model.
+        '''
+        step = model.schedule.steps
+        if (step > self.num_steps):
+            raise ValueError("Recording in " + self.path + " only has room for steps up to " + str(self.num_steps))
+        if self.cells is None:
+            self.allocate(model)
+        neighborhood = model.grid.neighborhood
+        frame = self.cells[step]
+        frame[:, 0] = np.frombuffer(neighborhood.types, dtype=np.uint8)
+        frame[:, 1] = np.frombuffer(neighborhood.belief_codes, dtype=np.uint8)
+        frame[:, 2] = np.frombuffer(neighborhood.flags, dtype=np.uint8)
+        if self.beliefs is not None:
+            agents = model.schedule.agents
+            cells = [neighborhood.cell(agent.pos) for agent in agents]
+            values = np.frombuffer(b"".join([agent.beliefs.tobytes() for agent in agents]), dtype=np.float64)
+            quantized = np.rint(np.clip(values, 0.0, 1.0)*LEVELS).astype(np.uint8).reshape(len(agents), -1)
+            self.beliefs[step] = 0
+            self.beliefs[step, cells] = quantized
+        row = self.index[step]
+        for name in COUNTERS:
+            row[name] = getattr(model, name)
+        row["steps"] = step
+
+    def close(self):
+        # write the recorded steps out and release the files
+        for array in (self.cells, self.beliefs, self.index):
+            if array is not None:
+                array.flush()
+        self.cells = self.beliefs = self.index = None
+
+class Recording:
+    '''
+    Read-only view of a recording made by RunRecorder.
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "run.json")) as f:
+            self.run = json.load(f)
+        self.height = self.run["height"]
+        self.width = self.run["width"]
+        self.population = self.run["population"]
+        self.cells = np.load(os.path.join(path, "cells.npy"), mmap_mode="r")
+        self.beliefs = np.load(os.path.join(path, "beliefs.npy"), mmap_mode="r") if self.run["beliefs"] else None
+        self.index = np.load(os.path.join(path, "index.npy"), mmap_mode="r")
+
+    def steps(self):
+        '''
+        Array of the recorded steps.
+        '''
+        return np.flatnonzero(self.index["steps"] >= 0)
+
+    def _check(self, step):
+        if not (0 <= step < len(self.index) and self.index["steps"][step] == step):
+            raise KeyError("Step " + str(step) + " is not in the recording " + self.path)
+
+    def frame(self, step):
+        '''
+        (cells, 3) array of type code, strongest belief code and flags per flat cell.
+        '''
+        self._check(step)
+        return self.cells[step]
+
+    def counters(self, step):
+        self._check(step)
+        row = self.index[step]
+        return {name: int(row[name]) for name in COUNTERS if name in row.dtype.names}
+
+    def belief_values(self, step):
+        '''
+        (height, width, beliefs) float array of the recorded beliefs (0 on empty cells), or None.
+        '''
+        self._check(step)
+        if self.beliefs is None:
+            return None
+        return self.beliefs[step].reshape(self.height, self.width, -1) / float(LEVELS)
+
+    def snapshot(self, step):
+        '''
+        The step as read by the visualization elements, like background.ModelSnapshot.
+        '''
+        frame = self.frame(step)
+        counters = self.counters(step)
+        types = frame[:, 0]
+        occupied = types != 255
+        counts = np.bincount(types[occupied].astype(np.intp)*len(self.population) + frame[occupied, 1]
+            , minlength=2*len(self.population)).reshape(2, -1)
+        snapshot = SimpleNamespace(origin=self, running=True, message="Replay of " + self.path, **counters)
+        snapshot.grid = SimpleNamespace(neighborhood=SimpleNamespace(height=self.height, width=self.width
+            , types=frame[:, 0].tobytes(), belief_codes=frame[:, 1].tobytes(), flags=frame[:, 2].tobytes()
+            , belief_counts=counts.tolist()))
+        snapshot.schedule = SimpleNamespace(steps=step)
+        snapshot.datacollector = SimpleNamespace(model_vars={name: [value] for name, value in counters.items()})
+        return snapshot
+
+if __name__ == "__main__":
+    from sweep import model_args
+    parser = argparse.ArgumentParser(description="Record a run of VirtuousEmotivistModel, for server.py --replay.")
+    parser.add_argument("spec", help="JSON spec as for sweep.py: \"base\" parameters, \"steps\", optional \"init_backend\"")
+    parser.add_argument("output", help="directory for the recording")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--beliefs", action="store_true", help="also record the quantized beliefs of every agent")
+    cli_args = parser.parse_args()
+    with open(cli_args.spec) as f:
+        spec = json.load(f)
+    recorder = RunRecorder(cli_args.output, spec["steps"], beliefs=cli_args.beliefs)
+    model = VirtuousEmotivistModel(*model_args(spec, [], cli_args.seed, ()), collect_agent_vars=False, collector=recorder
+        , init_backend=spec.get("init_backend", "python"))
+    model.run_to(spec["steps"])
+    recorder.close()
@@ -0,0 +1,72 @@
+import numpy as np
+
+'''
+Random number streams for the "Virtuous-Emotivist segregating opinion transfer model".
+
+Every VirtuousEmotivistModel draws from its own generator (model.random), seeded with init_seed,
+instead of the global random module, so a run gives the same result in any process and after
+any other run. The default stream is a random.Random; NumpyRandom is a drop-in with the same
+random() and shuffle() methods backed by a NumPy Generator. Its step_draws() pre-draws the
+random numbers of a whole step as arrays (activation order, neighbor orders, decision uniforms),
+which the scheduler and agents of model.py read by index instead of calling the stream once per
+draw. random() remains for the occasional draws outside them (empty cells to move to), handed
+out from blocks of uniforms drawn in bulk.
+'''
+
+class NumpyRandom:
+    '''
+    random.Random-like stream drawing blocks of block_size uniforms from np.random.default_rng(seed).
+    '''
+    def __init__(self, seed=None, block_size=4096):
+        self.generator = np.random.default_rng(seed)
+        self.block_size = block_size
+        self._next = iter(()).__next__
+
+    def refill(self):
+        # tolist() gives Python floats, which are much faster to hand out than NumPy scalars
+        self._next = iter(self.generator.random(self.block_size).tolist()).__next__
+
+    def random(self):
+        try:
+            return self._next()
+        except StopIteration:
+            self.refill()
+            return self._next()
+
+    def shuffle(self, x):
+        '''
+        Shuffle list x in place, with one permutation drawn by the generator.
+        '''
+        x[:] = [x[i] for i in self.generator.permutation(len(x)).tolist()]
+
+    def step_draws(self, agents, neighbors):
+        '''
+        Random numbers of one step of "agents" agents with up to "neighbors" neighbors each:
+        the activation order (a permutation of range(agents)), and per agent in that order a
+        list of 1 + neighbors uniforms (a move decision, then one decision per neighbor) and
+        a random order of range(neighbors). All are lists of Python numbers.
+        '''
+        generator = self.generator
+        order = generator.permutation(agents).tolist()
+        uniforms = generator.random((agents, 1 + neighbors)).tolist()
+        neighbor_orders = generator.random((agents, neighbors)).argsort(axis=1).tolist()
+        return order, uniforms, neighbor_orders
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+    def seed(self, seed=None):
+        self.generator = np.random.default_rng(seed)
+        self._next = iter(()).__next__
+
+    def getstate(self):
+        '''
+        State of the stream: the bit generator state and the uniforms left in the current block.
+        '''
+        reduced = self._next.__self__.__reduce__() # (iter, (block,), position) or (iter, ((),)) when used up
+        left = list(reduced[1][0][reduced[2]:]) if len(reduced) > 2 else []
+        return (self.generator.bit_generator.state, left)
+
+    def setstate(self, state):
+        self.generator.bit_generator.state = state[0]
+        self._next = iter(list(state[1])).__next__
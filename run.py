@@ -1,3 +1,3 @@
-from server import server
+from server import main
 
-server.launch()
+main()
@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from sweep import model_args, steady_state_detector
+
+'''
+Streaming Sobol sensitivity analysis of the proportion of virtuous agents over time.
+
+run_sensitivity runs one model per row of a Saltelli sample (param_values, as from
+SALib.sample.saltelli.sample(problem, N)) on a local process pool. Each worker records
+virtuous_count / agent count every step_size steps into a fixed array, and the main process
+writes every finished row into a .npy file opened as a memory map, next to a mask of finished rows,
+so an interrupted run resumes where it stopped and the Y matrix never has to fit in memory.
+analyze_sensitivity then runs sobol.analyze per recorded step, reading the file in blocks of steps
+and optionally analyzing the blocks in parallel.
+
+Problem names are VirtuousEmotivistModel parameter names ("random_seed" is init_seed); the other
+parameters come from "base" and sweep.DEFAULT_PARAMS.
+
+    python sensitivity.py problem.json 1000 results.npy --steps 300 --workers 4
+'''
+
+NAME_ALIASES = {"random_seed": "init_seed"}
+
+def _names(problem):
+    return [NAME_ALIASES.get(name, name) for name in problem["names"]]
+
+def sensitivity_rows(names, rows, base, num_steps, step_size, engine="agents", steady_state=None, cache=None):
+    '''
+    Run the models of rows, a list of (row index, parameter values), and return a list of
+    (row index, array of the virtuous proportion at steps step_size, 2*step_size, ..., num_steps).
+    cache is an optional {"path": ..., "max_mb": ...} as in sweep specs: agent-based runs are
+    then taken from a cache.ResultCache, so rows repeated across analyses are not run again.
+    '''
+    spec = {"base": base or {}, "steady_state": steady_state}
+    args = [model_args(spec, names, index, values) for index, values in rows] # init_seed defaults to the row index
+    steps = list(range(step_size, num_steps+1, step_size))
+    if (engine == "vectorized"):
+        from engine import VirtuousEmotivistEnsemble
+        series = np.zeros((len(rows), len(steps)), dtype=np.float32)
+        ensemble = VirtuousEmotivistEnsemble(args)
+        for i, step in enumerate(steps):
+            ensemble.run(step)
+            agents = ensemble.agent_count()
+            series[:, i] = np.where(agents > 0, ensemble.virtuous_count / np.maximum(agents, 1), 0.0)
+        return [(index, values) for (index, _), values in zip(rows, series)]
+
+    results = []
+    if cache is not None:
+        from cache import ResultCache
+        result_cache = ResultCache(cache["path"], int(cache.get("max_mb", 1024)*2**20))
+        for (index, _), arg in zip(rows, args):
+            series = result_cache.run(arg, num_steps, steady_state=steady_state or None)
+            virtuous = series["virtuous_count"][steps].astype(np.float32)
+            agents = virtuous + series["emotivist_count"][steps]
+            results.append((index, np.where(agents > 0, virtuous / np.maximum(agents, 1), 0.0)))
+        return results
+
+    from model import VirtuousEmotivistModel
+    from collector import ColumnarCollector
+    for (index, _), arg in zip(rows, args):
+        collector = ColumnarCollector(num_steps, reporters=[], sample_steps=steps)
+        model = VirtuousEmotivistModel(*arg, collect_agent_vars=False, collector=collector
+            , steady_state=steady_state_detector(spec))
+        model.run_to(num_steps)
+        virtuous = collector.get_model_vars("virtuous_count").astype(np.float32)
+        agents = virtuous + collector.get_model_vars("emotivist_count")
+        results.append((index, np.where(agents > 0, virtuous / np.maximum(agents, 1), 0.0)))
+    return results
+
+def _open_results(path, shape):
+    done_path = path[:-len(".npy")] + "_done.npy"
+    if os.path.exists(path) and os.path.exists(done_path):
+        Y = np.load(path, mmap_mode="r+")
+        done = np.load(done_path, mmap_mode="r+")
+        if (Y.shape != shape):
+            raise ValueError("Existing results in " + path + " have shape " + str(Y.shape) + ", expected " + str(shape))
+    else:
+        Y = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=shape)
+        done = np.lib.format.open_memmap(done_path, mode="w+", dtype=bool, shape=(shape[0],))
+    return Y, done
+
+def run_sensitivity(problem, param_values, path, num_steps=300, step_size=1, base=None, workers=None
+        , chunk_size=10, engine="agents", steady_state=None, progress=True, cache=None):
+    '''
+    Fill the (rows, num_steps//step_size) float32 array in the .npy file at path with the virtuous
+    proportion of every row of param_values, skipping rows finished by an earlier call.
+    steady_state is an optional dict of convergence.SteadyStateDetector arguments, cache an
+    optional result cache for the agents engine (see sensitivity_rows).
+    Returns the array as a read-only memory map.
+    '''
+    names = _names(problem)
+    Y, done = _open_results(path, (len(param_values), num_steps // step_size))
+    todo = [(i, tuple(param_values[i])) for i in np.flatnonzero(~done)]
+    chunks = [todo[i:i+chunk_size] for i in range(0, len(todo), chunk_size)]
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(sensitivity_rows, names, chunk, base, num_steps, step_size, engine, steady_state
+            , cache) for chunk in chunks]
+        for future in as_completed(futures):
+            for index, series in future.result():
+                Y[index] = series
+                done[index] = True
+            Y.flush()
+            done.flush()
+            if progress:
+                print("run_sensitivity: " + str(int(done.sum())) + "/" + str(len(done)) + " rows done", file=sys.stderr)
+    del Y, done
+    return np.load(path, mmap_mode="r")
+
+def _analyze_block(problem, path, start, stop, calc_second_order):
+    from SALib.analyze import sobol
+    block = np.asarray(np.load(path, mmap_mode="r")[:, start:stop], dtype=float)
+    return start, [sobol.analyze(problem, block[:, i], calc_second_order=calc_second_order) for i in range(block.shape[1])]
+
+def analyze_sensitivity(problem, path, block_steps=50, workers=1, calc_second_order=True):
+    '''
+    Sobol indices of every recorded step in the .npy file at path, analyzed block_steps columns
+    at a time (in parallel with workers > 1). Returns {"S1", "S1_conf", "ST", "ST_conf"} arrays
+    of shape (steps, num_vars), also saved next to path as <name>_si.npz.
+    '''
+    steps = np.load(path, mmap_mode="r").shape[1]
+    keys = ["S1", "S1_conf", "ST", "ST_conf"]
+    indices = {key: np.zeros((steps, problem["num_vars"])) for key in keys}
+    blocks = [(start, min(start+block_steps, steps)) for start in range(0, steps, block_steps)]
+    if (workers == 1):
+        results = (_analyze_block(problem, path, start, stop, calc_second_order) for start, stop in blocks)
+        _store_indices(indices, results)
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(_analyze_block, problem, path, start, stop, calc_second_order) for start, stop in blocks]
+            _store_indices(indices, (future.result() for future in as_completed(futures)))
+    np.savez(path[:-len(".npy")] + "_si.npz", **indices)
+    return indices
+
+def _store_indices(indices, results):
+    for start, block in results:
+        for i, si in enumerate(block):
+            for key in indices:
+                indices[key][start+i] = si[key]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sobol sensitivity of the virtuous proportion over time.")
+    parser.add_argument("problem", help="JSON SALib problem, optionally with a base dict of fixed parameters")
+    parser.add_argument("samples", type=int, help="N of the Saltelli sample")
+    parser.add_argument("output", help=".npy file for the time series, resumed if it exists")
+    parser.add_argument("--steps", type=int, default=300)
+    parser.add_argument("--step-size", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--engine", default="agents", choices=["agents", "vectorized"])
+    parser.add_argument("--cache", default=None, help="directory of a cache.ResultCache for agent-based runs")
+    cli_args = parser.parse_args()
+    from SALib.sample import saltelli
+    with open(cli_args.problem) as f:
+        problem = json.load(f)
+    base = problem.pop("base", None)
+    # keep the sample next to the results, so a resumed run uses the same rows
+    sample_path = cli_args.output[:-len(".npy")] + "_X.npy"
+    if os.path.exists(sample_path):
+        param_values = np.load(sample_path)
+    else:
+        param_values = saltelli.sample(problem, cli_args.samples)
+        np.save(sample_path, param_values)
+    run_sensitivity(problem, param_values, cli_args.output, cli_args.steps, cli_args.step_size, base
+        , cli_args.workers, engine=cli_args.engine, cache=None if cli_args.cache is None else {"path": cli_args.cache})
+    analyze_sensitivity(problem, cli_args.output, workers=cli_args.workers)
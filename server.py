@@ -1,5 +1,7 @@
+import argparse
+
 from mesa.visualization.ModularVisualization import ModularServer, VisualizationElement
-from mesa.visualization.modules import CanvasGrid, ChartModule, TextElement
+from mesa.visualization.modules import ChartModule, TextElement
 from mesa.visualization.UserParam import UserSettableParameter
 
 from mesa.visualization.TextVisualization import (
@@ -7,9 +9,8 @@ from mesa.visualization.TextVisualization import (
 )
 
 from model import VirtuousEmotivistModel, EmotivistAgent, VirtuousAgent
-
-import numpy as np
-import string
+from visualization import GridFrameModule, BackgroundControlModule
+from background import BackgroundModularServer, ReplayModularServer
 
 GRID_WIDTH = 25
 GRID_HEIGHT = 25
@@ -33,15 +34,8 @@ class HistogramModule(VisualizationElement):
         self.js_code = "elements.push(" + new_element + ");"
     
     def render(self, model):
-        if (type != None):
-            belief_vals = [agent.strongest_belief() for agent in model.schedule.agents if isinstance(agent, self.type)]
-        else:
-            belief_vals = [agent.strongest_belief() for agent in model.schedule.agents]
-        
-        for i in range(0,len(belief_vals)):
-            belief_vals[i] = string.ascii_lowercase.index(belief_vals[i].lower()) - string.ascii_lowercase.index('a')
-        hist = np.histogram(belief_vals, bins=self.bins)[0]
-        return [int(x) for x in hist]
+        # agents per strongest belief code (0 for A), counted by the grid's neighborhood as they change
+        return list(model.grid.neighborhood.belief_counts[self.type.type_code])
 
 class MiscMessageElement(TextElement):
     '''
@@ -79,7 +73,9 @@ class ConvincedElement(TextElement):
 
 def ve_draw(agent):
     '''
-    Portrayal Method for canvas
+    Portrayal Method for mesa.visualization.modules.CanvasGrid, unused since canvas_element is a
+    GridFrameModule. CanvasGrid(ve_draw, GRID_HEIGHT, GRID_WIDTH, 500, 500) can still stand in for
+    it on small grids (it sends one JSON portrayal per agent per step)
     '''
     if agent is None:
         return
@@ -105,9 +101,12 @@ def ve_draw(agent):
 message_element = MiscMessageElement()
 happy_element = HappyElement()
 convinced_element = ConvincedElement()
-canvas_element = CanvasGrid(ve_draw, GRID_HEIGHT, GRID_WIDTH, 500, 500)
+canvas_element = GridFrameModule(500, 500)
 happy_chart = ChartModule([{"Label": "happy", "Color": "Black"}])
 convinced_chart = ChartModule([{"Label": "convinced", "Color": "Blue"}])
+# events per step, see model.EVENTS
+events_chart = ChartModule([{"Label": "arguments_succeeded", "Color": "Red"}, {"Label": "nudges", "Color": "Blue"} \
+    , {"Label": "conversions", "Color": "Green"}, {"Label": "random_moves", "Color": "Gray"}, {"Label": "unhappy_moves", "Color": "Black"}])
 virtuous_vs_emotivist_chart = ChartModule([{"Label": "virtuous_count", "Color": "Blue"}, {"Label": "emotivist_count", "Color": "Red"} \
     , {"Label": "virtuous_death_count", "Color": "Black"}])
 
@@ -117,6 +116,7 @@ vir_belief_histogram = HistogramModule(list(range(4)), 400, 400, VirtuousAgent)
 
 model_params = {
     "init_seed": 1,
+    "collect_agent_vars": False, # no element reads agent-level data, which would grow with every (fast-forwarded) step
     "height": GRID_HEIGHT,
     "width": GRID_WIDTH,
     "density": UserSettableParameter("slider", "Agent density", 0.8, 0.1, 0.975, 0.025),
@@ -155,8 +155,29 @@ model_params = {
     
 }
 
-server = ModularServer(VirtuousEmotivistModel,
-                       [canvas_element, message_element, virtuous_vs_emotivist_chart, happy_element, happy_chart, convinced_element, convinced_chart, emo_belief_histogram \
-                       , vir_belief_histogram],
-                       "VirtuousEmotivist", model_params)
-server.launch()
+elements = [canvas_element, message_element, virtuous_vs_emotivist_chart, happy_element, happy_chart, convinced_element, convinced_chart, events_chart \
+    , emo_belief_histogram, vir_belief_histogram]
+
+def main(argv=None):
+    '''
+    Parse the command line (argv, sys.argv[1:] by default) and launch the visualization server.
+    '''
+    parser = argparse.ArgumentParser(description="Browser visualization of the Virtuous-Emotivist model.")
+    parser.add_argument("--background", action="store_true", help="step the model in a background thread, ahead of the display")
+    parser.add_argument("--ahead", type=int, default=10, help="with --background, steps simulated past the step shown")
+    parser.add_argument("--history", type=int, default=64, help="with --background, recent steps kept as snapshots")
+    parser.add_argument("--replay", metavar="PATH", help="replay a run recorded with recording.py instead of running the model")
+    cli_args = parser.parse_args(argv)
+
+    if cli_args.replay:
+        server = ReplayModularServer(VirtuousEmotivistModel, [BackgroundControlModule()] + elements, "VirtuousEmotivist"
+            , path=cli_args.replay)
+    elif cli_args.background:
+        server = BackgroundModularServer(VirtuousEmotivistModel, [BackgroundControlModule()] + elements, "VirtuousEmotivist", model_params
+            , ahead=cli_args.ahead, history=cli_args.history)
+    else:
+        server = ModularServer(VirtuousEmotivistModel, elements, "VirtuousEmotivist", model_params)
+    server.launch()
+
+if __name__ == "__main__":
+    main()
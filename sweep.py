@@ -0,0 +1,405 @@
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from engine import PARAM_NAMES
+
+'''
+Headless parameter sweeps for the "Virtuous-Emotivist segregating opinion transfer model".
+
+A sweep is described by a JSON spec, for example
+
+    {
+        "base": {"minority_pc": 0.2, "num_to_convert": 1},
+        "grid": {"convert_prob": [0.0, 0.001, 0.002, 0.005, 0.01]},
+        "seeds": 20,
+        "steps": 300,
+        "record_every": 100,
+        "metrics": ["virtuous_count", "belief_count:A"]
+    }
+
+"base" overrides DEFAULT_PARAMS. The points are either the cartesian product of "grid", or the
+rows of a sample matrix "samples": {"names": [...], "values": [[...], ...]} (or "file": a path
+readable by np.loadtxt / np.load, e.g. a Saltelli sample). Every point is run with "seeds"
+seeds (init_seed = seed_start + task number, unless init_seed is one of the swept parameters;
+with "seed_mode": "replicate", init_seed = seed_start + replicate number, the same seeds at
+every point, so that repeated points are identical runs).
+Metrics are model-level counts (happy, convinced, virtuous_count, emotivist_count,
+virtuous_death_count) or "belief_count:<belief>", recorded every "record_every" steps.
+"engine" is "agents" (VirtuousEmotivistModel, default) or "vectorized" (engine.py), and
+"rng_backend" ("python" or "numpy") picks the random stream of VirtuousEmotivistModel, and
+"init_backend": "numpy" its vectorized initial placement.
+"steady_state": {"window": 20, "tolerance": 0} stops runs early once they settle (see
+convergence.py) and carries their final state forward to the recorded steps.
+"cache": {"path": "runs.cache", "max_mb": 1024} takes agent-based runs from a cache.ResultCache,
+shared across sweeps and sessions: identical runs are read back, and longer runs continue
+cached shorter ones.
+
+Tasks are run in chunks of "chunk_size" on a local process pool and every finished chunk is
+appended to a CSV file, so an interrupted sweep resumes where it stopped:
+
+    python sweep.py spec.json results.csv --workers 4
+
+With "adaptive", the number of seeds per point is not fixed but decided in rounds from the
+results of one metric column, and a swept axis can be refined where the outcome jumps:
+
+    "adaptive": {"metric": "virtuous_count@300", "min_seeds": 5, "batch": 5, "max_seeds": 100,
+                 "ci_width": 10, "stable_ks": 0.05,
+                 "refine": {"param": "convert_prob", "jump": 50, "min_spacing": 0.0001, "max_points": 40}}
+
+Every point first gets "min_seeds" seeds, then "batch" more per round until the confidence
+interval of its mean ("z" standard errors either side, default 1.96) is at most "ci_width"
+wide, or its distribution moved by at most "stable_ks" (Kolmogorov-Smirnov distance) with the
+last batch, or it has "max_seeds" seeds. "refine" (grid specs only) adds the midpoint between
+neighboring values of "param" (all other parameters equal) whose means differ by more than
+"jump", down to "min_spacing", up to "max_points" points in all. "seeds" is not used. Points
+and seeds are rebuilt from the CSV file, so adaptive sweeps resume like fixed ones.
+'''
+
+DEFAULT_PARAMS = {"init_seed": 1, "height": 25, "width": 25, "density": 0.8, "minority_pc": 0.2, "homophily": 2
+    , "virtuous_homophily": 4, "nudge_amount": 0.01, "num_to_argue": 8, "num_to_convert": 1, "convert_prob": 0.001
+    , "convinced_threshold": 0.98, "random_move_prob": 0.0, "traditionless_life_decrease": 0.01
+    , "vir_a": 0.3, "vir_b": 0.4, "vir_c": 0.3, "emo_a": 0.3, "emo_b": 0.4, "emo_c": 0.3
+    , "emo_bias_a": 1.0, "emo_bias_b": 1.0, "emo_bias_c": 1.0, "strongest_belief_weight": 0.7
+    , "count_extra_pow": 0, "count_extra_det": 0, "count_extra_det_pow": 0, "extra_pow": 2, "extra_det": 0.75
+    , "belief_of_extra_pow": "A", "belief_of_extra_det": "A", "belief_of_extra_det_pow": "A"} # as in server.py
+INT_PARAMS = ["init_seed", "height", "width", "homophily", "virtuous_homophily", "num_to_argue", "num_to_convert"
+    , "count_extra_pow", "count_extra_det", "count_extra_det_pow"]
+
+def sweep_points(spec):
+    '''
+    Returns (swept parameter names, list of value tuples) of a spec.
+    '''
+    if "grid" in spec:
+        names = list(spec["grid"])
+        return names, list(itertools.product(*[spec["grid"][name] for name in names]))
+    samples = spec["samples"]
+    if "file" in samples:
+        path = samples["file"]
+        values = np.load(path) if path.endswith(".npy") else np.loadtxt(path, ndmin=2)
+    else:
+        values = np.array(samples["values"], dtype=float)
+    return list(samples["names"]), [tuple(row) for row in values.tolist()]
+
+def sweep_tasks(spec):
+    '''
+    Returns (swept parameter names, list of (task, point, seed, values)).
+    '''
+    names, points = sweep_points(spec)
+    seeds = spec.get("seeds", 1)
+    tasks = []
+    for point, values in enumerate(points):
+        for replicate in range(seeds):
+            task = len(tasks)
+            tasks.append((task, point, task_seed(spec, task, replicate), values))
+    return names, tasks
+
+def task_seed(spec, task, replicate):
+    return spec.get("seed_start", 0) + (replicate if spec.get("seed_mode", "task") == "replicate" else task)
+
+def model_args(spec, names, seed, values):
+    params = dict(DEFAULT_PARAMS)
+    params.update(spec.get("base", {}))
+    params["init_seed"] = seed
+    params.update(zip(names, values))
+    for name in INT_PARAMS:
+        params[name] = int(round(params[name]))
+    return tuple(params[name] for name in PARAM_NAMES)
+
+def record_steps(spec):
+    steps = spec["steps"]
+    return sorted(set(range(0, steps+1, spec.get("record_every", steps))[1:]) | {steps})
+
+def metric_columns(spec):
+    return [metric + "@" + str(step) for step in record_steps(spec) for metric in spec["metrics"]]
+
+def steady_state_detector(spec):
+    settings = spec.get("steady_state")
+    if not settings:
+        return None
+    from convergence import SteadyStateDetector
+    return SteadyStateDetector(**settings)
+
+def _metric(model, metric):
+    if metric.startswith("belief_count:"):
+        return model.belief_count(metric.split(":", 1)[1])
+    return getattr(model, metric)
+
+def run_chunk(spec, names, chunk):
+    '''
+    Run a list of tasks and return one CSV row (task, point, seed, swept values, metrics) per task.
+    '''
+    steps = record_steps(spec)
+    args = [model_args(spec, names, seed, values) for task, point, seed, values in chunk]
+    rows = [[task, point, arg[0]] + list(values) for (task, point, seed, values), arg in zip(chunk, args)]
+    if spec.get("engine", "agents") == "vectorized":
+        from engine import VirtuousEmotivistEnsemble
+        ensemble = VirtuousEmotivistEnsemble(args)
+        for step in steps:
+            ensemble.run(step)
+            for metric in spec["metrics"]:
+                for row, value in zip(rows, _metric(ensemble, metric)):
+                    row.append(int(value))
+        return rows
+
+    if "cache" in spec:
+        from cache import ResultCache
+        cache = ResultCache(spec["cache"]["path"], int(spec["cache"].get("max_mb", 1024)*2**20))
+        for row, arg in zip(rows, args):
+            series = cache.run(arg, steps[-1], spec.get("rng_backend", "python"), spec.get("init_backend", "python")
+                , spec.get("steady_state") or None)
+            for step in steps:
+                for metric in spec["metrics"]:
+                    row.append(int(series[metric][step]))
+        return rows
+
+    from model import VirtuousEmotivistModel
+    from collector import ColumnarCollector
+    beliefs = any(metric.startswith("belief_count:") for metric in spec["metrics"])
+    for row, arg in zip(rows, args):
+        collector = ColumnarCollector(steps[-1], reporters=["strongest_belief"] if beliefs else [], sample_steps=steps)
+        model = VirtuousEmotivistModel(*arg, collect_agent_vars=False, collector=collector
+            , rng_backend=spec.get("rng_backend", "python"), steady_state=steady_state_detector(spec)
+            , init_backend=spec.get("init_backend", "python"))
+        model.run_to(steps[-1])
+        for sample in range(collector.samples):
+            for metric in spec["metrics"]:
+                if metric.startswith("belief_count:"):
+                    row.append(collector.belief_count(metric.split(":", 1)[1], sample))
+                else:
+                    row.append(int(collector.get_model_vars(metric)[sample]))
+    return rows
+
+def finished_tasks(path):
+    '''
+    Tasks already in the CSV file at path. A row cut off by an interrupted write is removed.
+    '''
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+    with open(path, newline="") as f:
+        return set(int(row["task"]) for row in csv.DictReader(f))
+
+def run_tasks(spec, names, tasks, path, executor, finished=0, total=None, progress=True):
+    '''
+    Run tasks on executor in chunks, appending their rows to the CSV file at path as chunks finish.
+    '''
+    chunk_size = spec.get("chunk_size", 8)
+    chunks = [tasks[i:i+chunk_size] for i in range(0, len(tasks), chunk_size)]
+    total = finished + len(tasks) if total is None else total
+    write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, "a", newline="") as f:
+        writer = csv.writer(f)
+        if write_header:
+            writer.writerow(["task", "point", "init_seed"] + names + metric_columns(spec))
+        futures = [executor.submit(run_chunk, spec, names, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            rows = future.result()
+            writer.writerows(rows)
+            f.flush()
+            finished += len(rows)
+            if progress:
+                print(str(finished) + "/" + str(total) + " tasks done", file=sys.stderr)
+
+def run_sweep(spec, path, workers=None, progress=True):
+    '''
+    Run all tasks of spec that are not in the CSV file at path yet, appending their rows to it.
+    '''
+    if "adaptive" in spec:
+        return run_adaptive_sweep(spec, path, workers, progress)
+    names, tasks = sweep_tasks(spec)
+    done = finished_tasks(path)
+    todo = [task for task in tasks if task[0] not in done]
+    with ProcessPoolExecutor(workers) as executor:
+        run_tasks(spec, names, todo, path, executor, len(done), len(tasks), progress)
+
+def _value(text):
+    # a swept value read back from a CSV file
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+def ks_distance(a, b):
+    '''
+    Kolmogorov-Smirnov distance between the empirical distributions of samples a and b.
+    '''
+    a = np.sort(a)
+    b = np.sort(b)
+    values = np.union1d(a, b)
+    return float(np.max(np.abs(np.searchsorted(a, values, side="right")/len(a) - np.searchsorted(b, values, side="right")/len(b))))
+
+def settled(outcomes, settings):
+    '''
+    True if the outcomes of a point (in task order) meet the confidence interval or distribution
+    stability target of the adaptive settings.
+    '''
+    outcomes = np.asarray(outcomes, dtype=float)
+    n = len(outcomes)
+    if ("ci_width" in settings and n > 1
+            and 2*settings.get("z", 1.96)*outcomes.std(ddof=1)/math.sqrt(n) <= settings["ci_width"]):
+        return True
+    batch = settings.get("batch", settings.get("min_seeds", 5))
+    if ("stable_ks" in settings and n > batch and ks_distance(outcomes[:-batch], outcomes) <= settings["stable_ks"]):
+        return True
+    return False
+
+def refine_points(spec, names, points, outcomes):
+    '''
+    New points of an adaptive sweep: midpoints between neighbors along the "refine" parameter
+    whose mean outcomes differ by more than "jump".
+    '''
+    settings = spec["adaptive"]
+    refine = settings.get("refine")
+    if not refine:
+        return []
+    axis = names.index(refine["param"])
+    min_seeds = settings.get("min_seeds", 5)
+    lines = {}
+    for values, results in zip(points, outcomes):
+        if values is None:
+            continue
+        if len(results) < min_seeds:
+            return [] # wait until every point has its first estimate
+        lines.setdefault(values[:axis] + values[axis+1:], []).append((values[axis], np.mean(results)))
+    new = []
+    room = refine.get("max_points", 100) - len(points)
+    for rest, line in lines.items():
+        line.sort()
+        for (low, low_mean), (high, high_mean) in zip(line, line[1:]):
+            middle = float("{:.12g}".format((low + high)/2.0))
+            if refine["param"] in INT_PARAMS:
+                middle = float(int(middle))
+            if (len(new) >= room or abs(high_mean - low_mean) <= refine["jump"]
+                    or high - low <= refine.get("min_spacing", 0.0) or middle in (low, high)):
+                continue
+            new.append(rest[:axis] + (middle,) + rest[axis:])
+    return new
+
+def plan_round(spec, names, points, outcomes):
+    '''
+    Next round of an adaptive sweep: (new points, list of (point, number of new seeds)), where
+    the new points are numbered after the given ones. The plan is empty when the sweep is done.
+    '''
+    settings = spec["adaptive"]
+    min_seeds = settings.get("min_seeds", 5)
+    batch = settings.get("batch", min_seeds)
+    max_seeds = settings.get("max_seeds", 100)
+    plan = []
+    for point, (values, results) in enumerate(zip(points, outcomes)):
+        n = len(results)
+        if values is None:
+            continue
+        if n < min_seeds:
+            plan.append((point, min_seeds - n))
+        elif n < max_seeds and not settled(results, settings):
+            plan.append((point, min(batch, max_seeds - n)))
+    new = refine_points(spec, names, points, outcomes)
+    plan.extend((len(points) + i, min_seeds) for i in range(len(new)))
+    return new, plan
+
+def adaptive_state(spec, path):
+    '''
+    (swept names, points, outcomes per point, next task number) of an adaptive sweep from its CSV file.
+    The spec's points come first, then the refined points in the order they were added. A refined
+    point whose rows were all lost to an interruption is None.
+    '''
+    names, points = sweep_points(spec)
+    metric = spec["adaptive"]["metric"]
+    if metric not in metric_columns(spec):
+        raise ValueError("Adaptive metric " + metric + " is not one of the recorded columns " + str(metric_columns(spec)))
+    outcomes = [[] for values in points]
+    next_task = 0
+    if os.path.exists(path):
+        finished_tasks(path) # drop a cut off last row
+        with open(path, newline="") as f:
+            rows = sorted(csv.DictReader(f), key=lambda row: int(row["task"]))
+        for row in rows:
+            point = int(row["point"])
+            while point >= len(points):
+                points.append(None)
+                outcomes.append([])
+            if points[point] is None:
+                points[point] = tuple(_value(row[name]) for name in names)
+            outcomes[point].append(float(row[metric]))
+            next_task = int(row["task"]) + 1
+    return names, points, outcomes, next_task
+
+def run_adaptive_sweep(spec, path, workers=None, progress=True):
+    '''
+    Run an adaptive sweep (see the module docstring) until no point needs more seeds, appending to
+    the CSV file at path. Returns the number of rounds run.
+    '''
+    rounds = 0
+    with ProcessPoolExecutor(workers) as executor:
+        while rounds < spec["adaptive"].get("max_rounds", 1000):
+            names, points, outcomes, next_task = adaptive_state(spec, path)
+            new, plan = plan_round(spec, names, points, outcomes)
+            if not plan:
+                break
+            points = points + new
+            tasks = []
+            for point, count in plan:
+                seeded = len(outcomes[point]) if point < len(outcomes) else 0
+                for replicate in range(seeded, seeded + count):
+                    task = next_task + len(tasks)
+                    tasks.append((task, point, task_seed(spec, task, replicate), points[point]))
+            rounds += 1
+            if progress:
+                print("round " + str(rounds) + ": " + str(len(tasks)) + " tasks at " + str(len(plan)) + " of "
+                    + str(len(points)) + " points", file=sys.stderr)
+            run_tasks(spec, names, tasks, path, executor, progress=progress)
+    return rounds
+
+def point_summary(spec, path):
+    '''
+    Per point of a sweep CSV file: (swept values, seeds, mean, confidence interval width) of the
+    adaptive metric (or the first metric column), in point order.
+    '''
+    metric = spec.get("adaptive", {}).get("metric", metric_columns(spec)[0])
+    z = spec.get("adaptive", {}).get("z", 1.96)
+    names = sweep_points(spec)[0]
+    columns = load_results(path)
+    summary = []
+    for point in np.unique(columns["point"]).astype(int).tolist():
+        rows = columns["point"] == point
+        outcomes = columns[metric][rows]
+        n = len(outcomes)
+        width = 2*z*outcomes.std(ddof=1)/math.sqrt(n) if n > 1 else float("inf")
+        summary.append((tuple(columns[name][rows][0].item() for name in names), n, float(outcomes.mean()), float(width)))
+    return summary
+
+def load_results(path):
+    '''
+    Read a sweep CSV file into {column: array}, sorted by task.
+    '''
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    rows.sort(key=lambda row: int(row["task"]))
+    columns = {}
+    for name in (rows[0] if rows else []):
+        values = [row[name] for row in rows]
+        try:
+            columns[name] = np.array(values, dtype=float)
+        except ValueError:
+            columns[name] = np.array(values)
+    return columns
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a parameter sweep of VirtuousEmotivistModel.")
+    parser.add_argument("spec", help="JSON sweep spec")
+    parser.add_argument("output", help="CSV file for the results, appended to when resuming")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: all cores)")
+    cli_args = parser.parse_args()
+    with open(cli_args.spec) as f:
+        run_sweep(json.load(f), cli_args.output, cli_args.workers)
@@ -0,0 +1,20 @@
+import numpy as np
+
+from cache import ResultCache, SeriesCollector, cache_key
+from model import VirtuousEmotivistModel
+from sweep import model_args
+
+def test_extend_cached_run(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    args = model_args({"base": {"convert_prob": 0.01}}, [], 3, ())
+    cache.run(args, 20)
+    series = cache.run(args, 40) # continues the 20-step entry
+    collector = SeriesCollector()
+    model = VirtuousEmotivistModel(*args, collect_agent_vars=False, collector=collector)
+    model.run_to(40)
+    for name, values in collector.arrays(40).items():
+        assert np.array_equal(series[name], values)
+
+def test_key():
+    assert cache_key((1, 25, 2.0)) == cache_key((1.0, 25.0, 2))
+    assert cache_key((1, 25, 2.0)) != cache_key((2, 25, 2.0))
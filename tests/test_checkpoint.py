@@ -0,0 +1,47 @@
+import pytest
+
+from checkpoint import checkpoint, fork, load, restore, save
+from model import VirtuousEmotivistModel
+from sweep import model_args
+
+BASE = {"convert_prob": 0.02, "random_move_prob": 0.02}
+
+def model_state(model):
+    neighborhood = model.grid.neighborhood
+    return ({name: getattr(model, name) for name in ["happy", "convinced", "virtuous_count", "emotivist_count"
+        , "virtuous_death_count"]}, bytes(neighborhood.types), bytes(neighborhood.belief_codes), list(model.grid.empties))
+
+@pytest.mark.parametrize("init_backend", ["python", "numpy"])
+@pytest.mark.parametrize("rng_backend", ["python", "numpy"])
+def test_restore_continues_identically(tmp_path, rng_backend, init_backend):
+    model = VirtuousEmotivistModel(*model_args({"base": BASE}, [], 3, ()), collect_agent_vars=False
+        , rng_backend=rng_backend, init_backend=init_backend)
+    model.run_to(10)
+    state = checkpoint(model)
+    save(state, str(tmp_path / "model.pkl"))
+    restored = restore(state, collect_agent_vars=False)
+    loaded = restore(load(str(tmp_path / "model.pkl")), collect_agent_vars=False)
+    for copy in (model, restored, loaded):
+        copy.run_to(25)
+    assert model_state(restored) == model_state(model)
+    assert model_state(loaded) == model_state(model)
+
+def test_forks_diverge():
+    model = VirtuousEmotivistModel(*model_args({"base": BASE}, [], 1, ()), collect_agent_vars=False)
+    model.run_to(5)
+    state = checkpoint(model)
+    forks = [fork(state, seed, collect_agent_vars=False) for seed in (98, 99)]
+    for forked in forks:
+        forked.run_to(15)
+    assert model_state(forks[0]) != model_state(forks[1])
+    # a fork is repeatable
+    again = fork(state, 98, collect_agent_vars=False)
+    again.run_to(15)
+    assert model_state(again) == model_state(forks[0])
+
+def test_fork_strongest_belief_weight():
+    model = VirtuousEmotivistModel(*model_args({}, [], 1, ()), collect_agent_vars=False)
+    model.run_to(5)
+    forked = fork(checkpoint(model), 99, strongest_belief_weight=0.9)
+    assert forked.strongest_belief_weight == 0.9
+    assert forked.initial_beliefs[0] == pytest.approx([0.9, 0.05, 0.05])
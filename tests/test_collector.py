@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from collector import MODEL_REPORTERS, ColumnarCollector
+from model import VirtuousEmotivistModel
+from sweep import model_args
+
+STEPS = 20
+
+@pytest.mark.parametrize("interval", [1, 7])
+def test_matches_datacollector(interval):
+    collector = ColumnarCollector(STEPS, interval=interval)
+    model = VirtuousEmotivistModel(*model_args({"base": {"convert_prob": 0.02, "random_move_prob": 0.02}}, [], 1, ())
+        , collector=collector)
+    model.run_to(STEPS)
+    steps = collector.steps.tolist()
+    assert steps == sorted(set(list(range(0, STEPS+1, interval)) + [STEPS]))
+
+    for name in MODEL_REPORTERS:
+        expected = [model.datacollector.model_vars[name][step] for step in steps]
+        assert collector.get_model_vars(name).tolist() == expected, name
+
+    agents = model.datacollector.get_agent_vars_dataframe()
+    types = collector.get_agent_vars("type")
+    strongest = collector.get_agent_vars("strongest_belief")
+    beliefs = collector.get_agent_vars("beliefs")
+    happy = collector.get_agent_vars("happy")
+    convinced = collector.get_agent_vars("convinced")
+    for sample, step in enumerate(steps):
+        rows = agents.xs(step, level="Step")
+        assert np.count_nonzero(types[sample] >= 0) == len(rows)
+        for row in rows.itertuples():
+            cell = (sample, row.x, row.y)
+            assert types[cell] == row.type
+            assert model.population[strongest[cell]] == row.strongest_belief
+            assert happy[cell] == row.happy
+            assert convinced[cell] == row.convinced
+            # beliefs_string() has 2 decimals, the column float32
+            reported = [float(value) for value in row.beliefs.split()[1::2]]
+            assert beliefs[cell].tolist() == pytest.approx(reported, abs=0.005 + 1e-6)
+        for belief in model.population:
+            assert collector.belief_count(belief, sample) == np.count_nonzero(rows.strongest_belief == belief)
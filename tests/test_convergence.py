@@ -0,0 +1,25 @@
+import pytest
+
+from convergence import SteadyStateDetector
+from model import VirtuousEmotivistModel
+from sweep import model_args
+
+STEPS = 300
+
+# no conversions: the virtuous agents die out; frequent conversions: all emotivists are converted
+@pytest.mark.parametrize("base", [{"convert_prob": 0.0}, {"convert_prob": 0.05}])
+def test_settling_run_stops_and_carries_forward(base):
+    args = model_args({"base": base}, [], 1, ())
+    detector = SteadyStateDetector(window=20, tolerance=0)
+    model = VirtuousEmotivistModel(*args, collect_agent_vars=False, steady_state=detector)
+    model.run_to(STEPS)
+    full = VirtuousEmotivistModel(*args, collect_agent_vars=False)
+    full.run_to(STEPS)
+
+    assert not model.running
+    assert detector.settled_at is not None and detector.settled_at < STEPS
+    virtuous = model.datacollector.model_vars["virtuous_count"]
+    assert len(virtuous) == STEPS + 1
+    assert virtuous[detector.settled_at:] == [model.virtuous_count]*(STEPS + 1 - detector.settled_at)
+    for name in ["virtuous_count", "emotivist_count", "virtuous_death_count"]:
+        assert model.datacollector.model_vars[name][STEPS] == full.datacollector.model_vars[name][STEPS], name
@@ -0,0 +1,43 @@
+import pytest
+
+from engine import compare_engines, run_ensemble
+from model import VirtuousEmotivistModel
+from sweep import model_args
+from tiled import TiledVirtuousEmotivistModel
+
+SEEDS = range(40)
+STEPS = 40
+# below the two-sample KS critical value for 40 runs each at alpha = 0.001 (about 0.44);
+# the seeds are fixed, so the test is deterministic
+MAX_KS = 0.4
+
+MOVING = {"convert_prob": 0.01, "random_move_prob": 0.01}
+# strongest_belief_weight below 1/3: the sampled initial belief is not the strongest
+WEAK_BELIEFS = {"convert_prob": 0.01, "strongest_belief_weight": 0.2, "convinced_threshold": 0.5}
+
+ENGINES = {"vectorized": None
+    , "tiled": lambda *args: TiledVirtuousEmotivistModel(*args, workers=2)
+    , "numpy_init": lambda *args: VirtuousEmotivistModel(*args, collect_agent_vars=False, init_backend="numpy")}
+
+@pytest.mark.parametrize("engine, base", [("vectorized", MOVING), ("vectorized", WEAK_BELIEFS), ("tiled", MOVING)
+    , ("numpy_init", WEAK_BELIEFS)])
+def test_statistical_equivalence(engine, base):
+    args = model_args({"base": dict(base, height=15, width=15)}, [], 0, ())[1:]
+    options = {} if ENGINES[engine] is None else {"engine": ENGINES[engine]}
+    for name, (agent_based, other, ks) in compare_engines(args, SEEDS, STEPS, **options).items():
+        assert ks <= MAX_KS, name
+
+@pytest.mark.parametrize("base, virtuous, emotivist", [({"density": 0.0}, 0, 0), ({"minority_pc": 0.0}, 0, 500)
+    , ({"minority_pc": 1.0}, 500, 0), ({"belief_of_extra_pow": "D", "count_extra_pow": 5}, None, None)])
+def test_run_ensemble_edge_configurations(base, virtuous, emotivist):
+    # no agents, no virtuous agents (nothing converts), no emotivists, extras of an unknown belief (left out)
+    runs = [model_args({"base": base}, [], seed, ()) for seed in range(3)]
+    results = run_ensemble(runs, 10)
+    agent_based = VirtuousEmotivistModel(*runs[0], collect_agent_vars=False)
+    agent_based.run_to(10)
+    total = results["virtuous_count"] + results["emotivist_count"]
+    assert (total == agent_based.virtuous_count + agent_based.emotivist_count).all()
+    if virtuous is not None:
+        assert results["virtuous_count"].tolist() == [virtuous]*3
+        assert results["emotivist_count"].tolist() == [emotivist]*3
+    assert (results["happy"] <= total).all() and (results["convinced"] <= total).all()
@@ -0,0 +1,25 @@
+import pytest
+
+from model import VirtuousEmotivistModel
+from sweep import model_args
+
+def check_empty_index(grid):
+    empty = {(x, y) for x in range(grid.width) for y in range(grid.height) if grid.grid[x][y] is None}
+    assert len(grid.empties) == len(empty)
+    assert set(grid.empties) == empty
+    assert grid.empty_index == {pos: i for i, pos in enumerate(grid.empties)}
+
+@pytest.mark.parametrize("init_backend", ["python", "numpy"])
+def test_empty_index_through_moves_deaths_and_conversions(init_backend):
+    # unhappy virtuous agents die fast, conversions and random moves are frequent
+    base = {"convert_prob": 0.05, "random_move_prob": 0.05, "traditionless_life_decrease": 0.2}
+    model = VirtuousEmotivistModel(*model_args({"base": base}, [], 2, ()), collect_agent_vars=False
+        , init_backend=init_backend)
+    check_empty_index(model.grid)
+    for step in range(30):
+        model.step()
+        check_empty_index(model.grid)
+    events = model.datacollector.model_vars
+    assert sum(events["random_moves"]) > 0 and sum(events["unhappy_moves"]) > 0
+    assert sum(events["conversions"]) > 0
+    assert model.virtuous_death_count > 0
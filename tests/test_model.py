@@ -0,0 +1,19 @@
+import pytest
+
+from model import VirtuousEmotivistModel
+from sweep import model_args
+
+@pytest.mark.parametrize("init_backend", ["python", "numpy"])
+@pytest.mark.parametrize("strongest_belief_weight", [0.2, 0.7])
+def test_neighborhood_belief_codes(init_backend, strongest_belief_weight):
+    # below 1/3 the sampled belief is not the strongest one
+    args = model_args({"base": {"strongest_belief_weight": strongest_belief_weight}}, [], 1, ())
+    model = VirtuousEmotivistModel(*args, collect_agent_vars=False, init_backend=init_backend)
+    neighborhood = model.grid.neighborhood
+    counts = [[0]*len(model.population) for counts in neighborhood.belief_counts]
+    for agent in model.schedule.agents:
+        cell = neighborhood.cell(agent.pos)
+        assert neighborhood.belief_codes[cell] == agent.strongest
+        assert neighborhood.types[cell] == agent.type_code
+        counts[agent.type_code][agent.strongest] += 1
+    assert neighborhood.belief_counts == counts
@@ -0,0 +1,26 @@
+import csv
+
+from sweep import run_sweep
+
+SPEC = {"grid": {"convert_prob": [0.0, 0.01], "homophily": [2, 3]}, "seeds": 2, "steps": 10, "record_every": 5
+    , "metrics": ["virtuous_count", "happy", "belief_count:A"], "chunk_size": 2}
+
+def read_rows(path):
+    with open(path, newline="") as f:
+        rows = list(csv.reader(f))
+    return rows[0], sorted(rows[1:], key=lambda row: int(row[0])) # rows are appended as chunks finish
+
+def test_resume_after_interrupted_write(tmp_path):
+    full = str(tmp_path / "full.csv")
+    run_sweep(SPEC, full, workers=2, progress=False)
+    with open(full) as f:
+        text = f.read()
+    lines = text.splitlines(keepends=True)
+    assert len(lines) == 1 + 8
+
+    # interrupted in the middle of the fourth row
+    resumed = str(tmp_path / "resumed.csv")
+    with open(resumed, "w") as f:
+        f.write("".join(lines[:4]) + lines[4][:len(lines[4]) // 2])
+    run_sweep(SPEC, resumed, workers=2, progress=False)
+    assert read_rows(resumed) == read_rows(full)
@@ -0,0 +1,300 @@
+import multiprocessing
+from threading import BrokenBarrierError
+
+import numpy as np
+from mesa.datacollection import DataCollector
+
+from engine import EMPTY, EMOTIVIST, VIRTUOUS, PARAM_NAMES, STEP_PARAMS, GridState, array_layout \
+    , init_replica, interact, _ArraySchedule
+
+'''
+Domain-decomposed multi-process stepping for the "Virtuous-Emotivist segregating opinion transfer model".
+
+TiledVirtuousEmotivistModel runs one large grid with the step rules of the vectorized engine
+(engine.interact) on several worker processes. The torus is cut into 2*workers strips of whole
+rows (x ranges) and worker w owns strips 2w and 2w+1. The grid arrays live in shared memory that
+the forked workers inherit, so the halo of a strip (the rows just outside it) is read and written
+in place after a barrier instead of being copied; only agents that move are copied, through the
+transit buffers.
+
+One step:
+  1. Random moves: every worker lifts its random movers out of the grid into its transit buffer
+     and an exchange (3.) places them. Workers then draw the activation groups of their agents.
+  2. Activation group by activation group, the strips act one color at a time: the even strips
+     and the odd strips, in random order per group (running all groups of one color first
+     biases the outcomes, as one half of the grid would act before the other). Strips of one
+     color are never adjacent and have at least 2 rows, so the rows around an acting strip
+     belong to idle strips that no other acting strip reads or writes: arguments, strengthening
+     and conversions across a strip border are applied directly, without locks. Unhappy movers
+     and converted emotivists are lifted into the transit buffer, and an exchange places them
+     after every group and color.
+  3. Exchange, for moves across tile borders: every worker publishes how many agents it has in
+     transit and how many empty cells its strips have (cells just vacated included). All workers
+     then draw the same allocation of the movers to the workers (multivariate hypergeometric over
+     the empty cells, so every mover gets a uniformly random empty cell of the whole grid, as
+     with move_to_empty) and the same random order of the movers, and each worker copies its
+     share of them into random empty cells of its own strips.
+Workers wait on barriers between these phases.
+
+Runs are statistically (not bit-for-bit) equivalent to VirtuousEmotivistModel and depend on the
+number of workers; check a parameter set with
+engine.compare_engines(args, seeds, steps, engine=lambda *args: TiledVirtuousEmotivistModel(*args, workers=4)).
+Workers are forked, so this needs a platform with fork (Linux, macOS).
+'''
+
+MOVED = ("moved", bool) # extra per-cell array: the agent moved at random this step
+
+def shared_arrays(ctx, layout):
+    '''
+    Arrays of layout, a list of (name, shape, dtype), in one block of shared memory that forked
+    processes inherit.
+    '''
+    offsets = []
+    total = 0
+    for name, shape, dtype in layout:
+        offsets.append(total)
+        total += -(-int(np.prod(shape))*np.dtype(dtype).itemsize // 64)*64 # 64-byte aligned
+    raw = ctx.RawArray("b", max(total, 1))
+    return {name: np.frombuffer(raw, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+        for (name, shape, dtype), offset in zip(layout, offsets)}
+
+class TileState(GridState):
+    '''
+    The shared GridState (one replica) as seen by one worker. relocate() lifts agents into the
+    worker's transit buffer instead of moving them, and the "moved" array travels with the agents.
+    '''
+    def __init__(self, height, width, n_beliefs, arrays, worker):
+        cells = height*width
+        super().__init__(1, height, width, n_beliefs
+            , {name: arrays[name] for name, shape, dtype in array_layout(1, cells, n_beliefs)})
+        self.moved = arrays[MOVED[0]]
+        self.transit = [arrays["transit_" + name] for name in self.field_names(n_beliefs)]
+        self.worker = worker
+        self.lifted = 0
+
+    @staticmethod
+    def field_names(n_beliefs):
+        return [name for name, shape, dtype in array_layout(1, 1, n_beliefs)] + [MOVED[0]]
+
+    def agent_arrays(self):
+        return super().agent_arrays() + [self.moved]
+
+    def relocate(self, movers, rngs):
+        '''
+        Lift the agents at flat indices movers out of the grid into this worker's transit buffer.
+        '''
+        end = self.lifted + movers.size
+        for arr, buffer in zip(self.agent_arrays(), self.transit):
+            buffer[self.worker, self.lifted:end] = self.flat(arr)[movers]
+        self.clear(movers)
+        self.lifted = end
+        return np.zeros(self.cells, dtype=bool)
+
+class TileWorker:
+    '''
+    The part of TiledVirtuousEmotivistModel that runs in worker process "worker".
+    '''
+    def __init__(self, worker, workers, bounds, height, width, n_beliefs, arrays, params, entropy, groups, barrier):
+        self.worker = worker
+        self.workers = workers
+        self.state = TileState(height, width, n_beliefs, arrays, worker)
+        self.params = params
+        self.entropy = entropy
+        self.groups = groups
+        self.barrier = barrier
+        self.rng = np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(worker,)))
+        self.strips = [(bounds[2*worker]*width, bounds[2*worker+1]*width), (bounds[2*worker+1]*width, bounds[2*worker+2]*width)]
+        self.own = (self.strips[0][0], self.strips[1][1])
+        self.control = arrays["control"]
+        self.transit_count = arrays["transit_count"]
+        self.empty_count = arrays["empty_count"]
+        self.deaths = arrays["deaths"]
+        self.steps = 0
+        self.exchanges = 0
+
+    def agents(self, lo, hi, group=None):
+        # flat indices of the agents in cells lo:hi (of activation group "group", if given)
+        present = self.state.agent_type[0, lo:hi] != EMPTY
+        if (group is not None):
+            present &= self.state.group[0, lo:hi] == group
+        return lo + np.flatnonzero(present)
+
+    def shared_rng(self):
+        # the same stream on every worker, for the current step and exchange
+        return np.random.default_rng(np.random.SeedSequence(self.entropy, spawn_key=(self.workers, self.steps, self.exchanges)))
+
+    def exchange(self):
+        '''
+        Place the agents in transit on all workers into random empty cells of the whole grid.
+        '''
+        state = self.state
+        lo, hi = self.own
+        self.barrier.wait() # every worker is done lifting, also out of the halo rows of this one
+        self.transit_count[self.worker] = state.lifted
+        self.empty_count[self.worker] = np.count_nonzero(state.agent_type[0, lo:hi] == EMPTY)
+        self.barrier.wait()
+        self.exchanges += 1
+        counts = self.transit_count.copy()
+        total = int(counts.sum())
+        if (total > 0):
+            rng = self.shared_rng()
+            allocation = rng.multivariate_hypergeometric(self.empty_count.copy(), total)
+            order = rng.permutation(total)
+            start = int(allocation[:self.worker].sum())
+            incoming = order[start:start+allocation[self.worker]]
+            first = np.concatenate([[0], np.cumsum(counts)])
+            source = np.searchsorted(first, incoming, side="right") - 1
+            row = incoming - first[source]
+            empties = lo + np.flatnonzero(state.agent_type[0, lo:hi] == EMPTY)
+            dest = self.rng.choice(empties, size=incoming.size, replace=False)
+            for arr, buffer in zip(state.agent_arrays(), state.transit):
+                state.flat(arr)[dest] = buffer[source, row]
+        self.barrier.wait() # every worker has read the transit buffers
+        state.lifted = 0
+
+    def step(self):
+        state = self.state
+        params = self.params
+        lo, hi = self.own
+        self.steps = int(self.control[1])
+        self.exchanges = 0
+        first_colors = self.shared_rng().integers(2, size=self.groups)
+
+        # random moves, then activation groups drawn where the agents ended up
+        state.moved[0, lo:hi] = False
+        agents = self.agents(lo, hi)
+        movers = agents[self.rng.random(agents.size) < params["random_move_prob"][0]]
+        state.moved[0, movers] = True
+        state.relocate(movers, None)
+        self.exchange()
+        agents = self.agents(lo, hi)
+        state.group[0, agents] = self.rng.integers(self.groups, size=agents.size)
+        self.barrier.wait()
+
+        deaths = 0
+        for g in range(self.groups):
+            for color in (first_colors[g], 1 - first_colors[g]):
+                strip_lo, strip_hi = self.strips[color]
+                active = self.agents(strip_lo, strip_hi, g)
+                if (active.size > 0):
+                    draws = self.rng.random((active.size, 2, 8))
+                    deaths += int(interact(state, params, [self.rng], active, draws, state.flat(state.moved))[0])
+                self.exchange()
+        self.deaths[self.worker] += deaths
+
+def _run_worker(worker, workers, bounds, height, width, n_beliefs, arrays, params, entropy, groups, step_barrier, barrier):
+    tile = TileWorker(worker, workers, bounds, height, width, n_beliefs, arrays, params, entropy, groups, barrier)
+    try:
+        while True:
+            step_barrier.wait()
+            if tile.control[0]:
+                return
+            tile.step()
+            step_barrier.wait()
+    except BrokenBarrierError:
+        return
+    except BaseException:
+        # wake up the other workers and the model instead of leaving them waiting
+        barrier.abort()
+        step_barrier.abort()
+        raise
+
+class TiledVirtuousEmotivistModel:
+    '''
+    Grid stepped by "workers" worker processes, each owning two strips of rows of the torus (see
+    the module docstring). Takes the same arguments and exposes the same model-level outputs and
+    datacollector as engine.VectorizedVirtuousEmotivistModel. The grid needs at least 4 rows per
+    worker. Call close() (or use the model as a context manager) to stop the workers.
+    '''
+
+    def __init__(self, *model_args, workers=2, activation_groups=8):
+        run = dict(zip(PARAM_NAMES, model_args))
+        self.height = run["height"]
+        self.width = run["width"]
+        if (self.height < 4*workers):
+            raise ValueError("A tiled grid needs at least 4 rows per worker, got " + str(self.height) + " rows for "
+                + str(workers) + " workers")
+        self.population = ["A", "B", "C"]
+        self.workers = workers
+        n_beliefs = len(self.population)
+        cells = self.height*self.width
+        bounds = [(self.height*s) // (2*workers) for s in range(2*workers+1)]
+        # lifted in one phase at most: the agents of a worker's strips plus converted ones in the rows around them
+        capacity = max(bounds[2*w+2] - bounds[2*w] for w in range(workers))*self.width + 2*self.width
+        layout = array_layout(1, cells, n_beliefs) + [(MOVED[0], (1, cells), MOVED[1])]
+        layout += [("transit_" + name, (workers, capacity) + shape[2:], dtype) for name, shape, dtype in layout]
+        layout += [("transit_count", (workers,), np.int64), ("empty_count", (workers,), np.int64)
+            , ("deaths", (workers,), np.int64), ("control", (2,), np.int64)] # control: stop flag, step
+        ctx = multiprocessing.get_context("fork")
+        self.arrays = shared_arrays(ctx, layout)
+        self.state = GridState(1, self.height, self.width, n_beliefs
+            , {name: self.arrays[name] for name, shape, dtype in array_layout(1, cells, n_beliefs)})
+        self.params = {name: np.zeros(1) for name in STEP_PARAMS}
+        self.params["bias"] = np.zeros((1, n_beliefs))
+        seed = np.random.SeedSequence(run["init_seed"])
+        self.message = init_replica(self.state, self.params, 0, np.random.default_rng(seed), self.population, run)
+
+        self.step_barrier = ctx.Barrier(workers + 1)
+        barrier = ctx.Barrier(workers)
+        self.processes = [ctx.Process(target=_run_worker, args=(w, workers, bounds, self.height, self.width, n_beliefs
+            , self.arrays, self.params, seed.entropy, activation_groups, self.step_barrier, barrier), daemon=True)
+            for w in range(workers)]
+        for process in self.processes:
+            process.start()
+
+        self.schedule = _ArraySchedule(self)
+        self.update_counts()
+        self.datacollector = DataCollector(
+            {"happy": "happy", "convinced": "convinced", "emotivist_count": "emotivist_count" \
+                , "virtuous_count": "virtuous_count", "virtuous_death_count": "virtuous_death_count"})
+        self.running = True
+        self.datacollector.collect(self)
+
+    def update_counts(self):
+        self.happy = int(np.count_nonzero(self.state.happy))
+        self.convinced = int(np.count_nonzero(self.state.convinced))
+        self.emotivist_count = int(np.count_nonzero(self.state.agent_type == EMOTIVIST))
+        self.virtuous_count = int(np.count_nonzero(self.state.agent_type == VIRTUOUS))
+        self.virtuous_death_count = int(self.arrays["deaths"].sum())
+
+    def agent_count(self):
+        return int(np.count_nonzero(self.state.agent_type != EMPTY))
+
+    def step(self):
+        if not self.processes:
+            raise RuntimeError("The workers of this model are closed")
+        self.arrays["control"][1] = self.schedule.steps
+        try:
+            self.step_barrier.wait() # start the step
+            self.step_barrier.wait() # wait for it to finish
+        except BrokenBarrierError:
+            self.close()
+            raise RuntimeError("A tile worker failed, see its traceback above")
+        self.schedule.steps += 1
+        self.schedule.time += 1
+        self.update_counts()
+        self.datacollector.collect(self)
+
+    def close(self):
+        '''
+        Stop the worker processes. The model keeps its last state but can not step anymore.
+        '''
+        if not self.processes:
+            return
+        self.arrays["control"][0] = 1
+        try:
+            self.step_barrier.wait(timeout=10)
+        except BrokenBarrierError:
+            pass
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
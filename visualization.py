@@ -0,0 +1,75 @@
+import base64
+
+import numpy as np
+from mesa.visualization.ModularVisualization import VisualizationElement
+
+'''
+Compact grid frames for the ModularServer visualization of the "Virtuous-Emotivist segregating
+opinion transfer model" (server.py).
+
+CanvasGrid sends a portrayal dict per agent on every step, which is far more JSON than the
+browser can take for large grids. GridFrameModule sends 3 bytes per cell instead (type code,
+strongest belief code and display flags, straight from the arrays of the grid's neighborhood),
+and after the first frame only the cells that changed. GridFrameModule.js keeps the cells and
+redraws only those. mesa's websocket protocol is JSON, so the bytes travel base64 encoded.
+'''
+
+def encode(values):
+    return base64.b64encode(np.ascontiguousarray(values).tobytes()).decode("ascii")
+
+def grid_frame(neighborhood):
+    '''
+    (cells, 3) uint8 array of type code, strongest belief code and flags per flat cell.
+    '''
+    return np.stack([np.frombuffer(neighborhood.types, dtype=np.uint8)
+        , np.frombuffer(neighborhood.belief_codes, dtype=np.uint8)
+        , np.frombuffer(neighborhood.flags, dtype=np.uint8)], axis=1)
+
+class GridFrameModule(VisualizationElement):
+    '''
+    Canvas of the grid drawn from compact frames. A frame is sent in full for a new model (e.g.
+    after a reset) and when the same step is rendered again (e.g. for a second browser); otherwise
+    it is a delta from the previously sent frame: a bitmask of the changed flat cells (bit cell % 8
+    of byte cell // 8) and the 3 bytes of each changed cell, in cell order. The previous frame is
+    kept here, so like the rest of ModularServer this assumes one browser per model. Snapshots of
+    background.py count as their origin model, so frames between them are deltas as well.
+    '''
+    local_includes = ["GridFrameModule.js"]
+
+    def __init__(self, canvas_height=500, canvas_width=500):
+        self.canvas_height = canvas_height
+        self.canvas_width = canvas_width
+        self.js_code = "elements.push(new GridFrameModule({}, {}));".format(canvas_width, canvas_height)
+        self.model = None
+        self.steps = None
+        self.previous = None
+
+    def render(self, model):
+        neighborhood = model.grid.neighborhood
+        frame = grid_frame(neighborhood)
+        origin = getattr(model, "origin", model)
+        steps = model.schedule.steps
+        if (origin is self.model and steps != self.steps):
+            changed = (frame != self.previous).any(axis=1)
+            data = {"full": False, "steps": steps, "changed": encode(np.packbits(changed, bitorder="little"))
+                , "values": encode(frame[changed])}
+        else:
+            data = {"full": True, "steps": steps, "height": neighborhood.height, "width": neighborhood.width
+                , "values": encode(frame)}
+        self.model = origin
+        self.steps = steps
+        self.previous = frame
+        return data
+
+class BackgroundControlModule(VisualizationElement):
+    '''
+    Controls of background.BackgroundModularServer: the step shown, fast-forward by a number of
+    steps and show a step still in the server's snapshot history.
+    '''
+    local_includes = ["BackgroundControlModule.js"]
+
+    def __init__(self, fast_forward_steps=1000):
+        self.js_code = "elements.push(new BackgroundControlModule({}));".format(fast_forward_steps)
+
+    def render(self, model):
+        return model.schedule.steps